@@ -0,0 +1,22 @@
+"""add rank leaderboard index
+
+Revision ID: 3a9c1e7b52d4
+Revises: None
+Create Date: 2026-10-18 09:12:44.318201
+
+"""
+
+# revision identifiers, used by Alembic.
+revision = '3a9c1e7b52d4'
+down_revision = None
+
+from alembic import op
+import sqlalchemy as sa
+
+
+def upgrade():
+    op.create_index('ix_rank_hackathon_id_total_seconds', 'rank', ['hackathon_id', sa.text('total_seconds DESC'), sa.text('id DESC')])
+
+
+def downgrade():
+    op.drop_index('ix_rank_hackathon_id_total_seconds', table_name='rank')
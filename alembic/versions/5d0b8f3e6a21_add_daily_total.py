@@ -0,0 +1,32 @@
+"""add daily_total
+
+Revision ID: 5d0b8f3e6a21
+Revises: 3a9c1e7b52d4
+Create Date: 2026-10-18 11:40:07.902144
+
+"""
+
+# revision identifiers, used by Alembic.
+revision = '5d0b8f3e6a21'
+down_revision = '3a9c1e7b52d4'
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+def upgrade():
+    op.create_table('daily_total',
+        sa.Column('user_id', postgresql.UUID(as_uuid=True), nullable=False),
+        sa.Column('date', sa.Date(), nullable=False),
+        sa.Column('total_seconds', sa.Integer(), nullable=False),
+        sa.Column('finalized', sa.Boolean(), nullable=False),
+        sa.Column('created_at', sa.DateTime(), nullable=False),
+        sa.Column('modified_at', sa.DateTime(), nullable=True),
+        sa.ForeignKeyConstraint(['user_id'], ['user.id'], ),
+        sa.PrimaryKeyConstraint('user_id', 'date')
+    )
+
+
+def downgrade():
+    op.drop_table('daily_total')
@@ -0,0 +1,30 @@
+"""add unique constraint on rank user_id and hackathon_id
+
+Revision ID: 8c47e2a19f05
+Revises: 5d0b8f3e6a21
+Create Date: 2026-10-18 12:31:52.440613
+
+"""
+
+# revision identifiers, used by Alembic.
+revision = '8c47e2a19f05'
+down_revision = '5d0b8f3e6a21'
+
+from alembic import op
+
+
+def upgrade():
+
+    # concurrent joins could create duplicate ranks, keep the one with the
+    # most coding time
+    op.execute("""
+        DELETE FROM rank a USING rank b
+        WHERE a.user_id = b.user_id
+        AND a.hackathon_id = b.hackathon_id
+        AND (a.total_seconds, a.id) < (b.total_seconds, b.id)
+    """)
+    op.create_unique_constraint('uq_rank_user_id_hackathon_id', 'rank', ['user_id', 'hackathon_id'])
+
+
+def downgrade():
+    op.drop_constraint('uq_rank_user_id_hackathon_id', 'rank', type_='unique')
@@ -0,0 +1,30 @@
+"""add unique index on hackathon name
+
+Revision ID: b61d94c2e3a7
+Revises: 8c47e2a19f05
+Create Date: 2026-10-18 14:05:12.318044
+
+"""
+
+# revision identifiers, used by Alembic.
+revision = 'b61d94c2e3a7'
+down_revision = '8c47e2a19f05'
+
+from alembic import op
+
+
+def upgrade():
+
+    # names were not unique before, keep the oldest hackathon's name and
+    # suffix the others with the start of their id
+    op.execute("""
+        UPDATE hackathon a SET name = left(a.name, 91) || '-' || left(a.id::text, 8)
+        FROM hackathon b
+        WHERE a.name = b.name
+        AND (a.created_at, a.id) > (b.created_at, b.id)
+    """)
+    op.create_index('ix_hackathon_name', 'hackathon', ['name'], unique=True)
+
+
+def downgrade():
+    op.drop_index('ix_hackathon_name', table_name='hackathon')
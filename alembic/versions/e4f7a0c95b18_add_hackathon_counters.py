@@ -0,0 +1,37 @@
+"""add hackathon participants_count and total_seconds counters
+
+Revision ID: e4f7a0c95b18
+Revises: b61d94c2e3a7
+Create Date: 2026-10-18 15:22:41.907336
+
+"""
+
+# revision identifiers, used by Alembic.
+revision = 'e4f7a0c95b18'
+down_revision = 'b61d94c2e3a7'
+
+from alembic import op
+import sqlalchemy as sa
+
+
+def upgrade():
+    op.add_column('hackathon', sa.Column('participants_count', sa.Integer(), server_default='0', nullable=False))
+    op.add_column('hackathon', sa.Column('total_seconds', sa.BigInteger(), server_default='0', nullable=False))
+    op.execute("""
+        UPDATE hackathon SET
+            participants_count = counts.participants_count,
+            total_seconds = counts.total_seconds
+        FROM (
+            SELECT hackathon_id, count(*) AS participants_count, sum(total_seconds) AS total_seconds
+            FROM rank
+            GROUP BY hackathon_id
+        ) counts
+        WHERE hackathon.id = counts.hackathon_id
+    """)
+    op.create_index('ix_hackathon_coding_starts_at_id', 'hackathon', ['coding_starts_at', 'id'])
+
+
+def downgrade():
+    op.drop_index('ix_hackathon_coding_starts_at_id', table_name='hackathon')
+    op.drop_column('hackathon', 'total_seconds')
+    op.drop_column('hackathon', 'participants_count')
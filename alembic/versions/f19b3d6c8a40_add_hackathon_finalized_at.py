@@ -0,0 +1,22 @@
+"""add hackathon finalized_at
+
+Revision ID: f19b3d6c8a40
+Revises: e4f7a0c95b18
+Create Date: 2026-10-18 19:04:12.518240
+
+"""
+
+# revision identifiers, used by Alembic.
+revision = 'f19b3d6c8a40'
+down_revision = 'e4f7a0c95b18'
+
+from alembic import op
+import sqlalchemy as sa
+
+
+def upgrade():
+    op.add_column('hackathon', sa.Column('finalized_at', sa.DateTime(), nullable=True))
+
+
+def downgrade():
+    op.drop_column('hackathon', 'finalized_at')
@@ -44,6 +44,10 @@ app.current_user = current_user
 from app.views import blueprint as views
 app.register_blueprint(views)
 
+# Request Metrics
+from app.metrics import blueprint as metrics_blueprint
+app.register_blueprint(metrics_blueprint)
+
 # Compress static files
 from jac.contrib.flask import JAC
 jac = JAC(app)
@@ -10,11 +10,13 @@
 from functools import wraps
 from urlparse import urlparse, urljoin
 
-from app import app
-from app.models import User
+from app import app, cache
+from app.models import db, User
+from app.utils import uwsgi
 
 from flask import redirect, request, url_for
 from flask.ext.login import LoginManager, login_user, logout_user, login_required
+from sqlalchemy.orm import make_transient_to_detached
 
 
 # require some imports for other modules to use
@@ -23,23 +25,59 @@ assert login_user
 assert logout_user
 
 
-# try importing uwsgi, which will fail if we are not in app context
-# for example when running command line scripts or alembic
-class Uwsgi(object):
-    def set_logvar(*args, **kwargs):
-        pass
-try:
-    import uwsgi
-except ImportError:
-    uwsgi = Uwsgi()
-
 login_manager = LoginManager()
 login_manager.setup_app(app)
 
 
+# snapshots of logged in users' columns, keyed by user id and the
+# user's cache version, so changes committed by any process are seen
+user_snapshots = cache.LRUCache(
+    maxsize=app.config['USER_CACHE_SIZE'],
+    ttl=app.config['USER_CACHE_TIMEOUT'],
+)
+
+# secrets are never cached, they load from the database when accessed
+SNAPSHOT_COLUMNS = [column for column in User.__table__.columns.keys() if column != 'wakatime_token']
+
+
+def get_user_snapshot(user_id):
+    """Return a dict of a user's columns, from this process's cache,
+    memcached, or the database in that order. None if no such user.
+    """
+    namespace = cache.user_namespace(user_id)
+    version = cache.get_version(namespace)
+    snapshot = user_snapshots.get((user_id, version))
+    if snapshot is not None:
+        return snapshot
+
+    key = cache.make_key(namespace, version)
+    if app.config['USER_CACHE_MEMCACHED']:
+        snapshot = cache.get(key)
+
+    if snapshot is None:
+        row = db.session.query(*[getattr(User, column) for column in SNAPSHOT_COLUMNS]).filter(User.id == user_id).first()
+        if row is None:
+            return None
+        snapshot = dict(zip(SNAPSHOT_COLUMNS, row))
+        if app.config['USER_CACHE_MEMCACHED']:
+            cache.set(key, snapshot, timeout=app.config['USER_CACHE_TIMEOUT'])
+
+    user_snapshots.set((user_id, version), snapshot)
+    return snapshot
+
+
 @login_manager.user_loader
 def load_user(user_id):
-    user = User.query.filter_by(id=user_id).first()
+    snapshot = get_user_snapshot(user_id)
+    user = None
+    if snapshot is not None:
+
+        # attach a copy to this request's session without querying, columns
+        # missing from the snapshot are expired so they load on access
+        user = User(**snapshot)
+        make_transient_to_detached(user)
+        user = db.session.merge(user, load=False)
+
     if user:
         uwsgi.set_logvar('user_id', str(user.id))
     else:
@@ -0,0 +1,220 @@
+# -*- coding: utf-8 -*-
+"""
+    hackathonranks.cache
+    ~~~~~~~~~~~~~~~~~~~~
+
+    Memcached backed cache with versioned keys.
+
+    Cached values live under a namespace, like one hackathon's leaderboard.
+    Each namespace has a version counter in memcached which is part of every
+    key in that namespace, so incrementing the counter invalidates all of
+    them at once for every worker on every node.
+"""
+
+
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+
+import memcache
+
+from app import app
+
+
+class LocalClient(object):
+    """In-process stand-in for memcache.Client, for tests and local runs.
+    """
+
+    def __init__(self):
+        self._data = {}
+        self._lock = threading.Lock()
+
+        # entries read by gets, per thread like memcache.Client's cas ids
+        self._local = threading.local()
+
+    def _cas_ids(self):
+        if not hasattr(self._local, 'cas_ids'):
+            self._local.cas_ids = {}
+        return self._local.cas_ids
+
+    def _alive(self, key):
+        entry = self._data.get(key)
+        if entry is None:
+            return None
+        if entry[1] and entry[1] < time.time():
+            del self._data[key]
+            return None
+        return entry
+
+    def get(self, key):
+        with self._lock:
+            entry = self._alive(key)
+            return entry[0] if entry is not None else None
+
+    def get_multi(self, keys):
+        with self._lock:
+            found = {}
+            for key in keys:
+                entry = self._alive(key)
+                if entry is not None:
+                    found[key] = entry[0]
+            return found
+
+    def gets(self, key):
+        with self._lock:
+            entry = self._alive(key)
+            if entry is None:
+                self._cas_ids().pop(key, None)
+                return None
+            self._cas_ids()[key] = entry
+            return entry[0]
+
+    def set(self, key, val, time=0):
+        with self._lock:
+            self._data[key] = (val, self._expires(time))
+            return True
+
+    def cas(self, key, val, time=0):
+        """Set key only if it did not change since this thread's gets.
+        Without a gets first it is a plain set, like memcache.Client.
+        """
+        with self._lock:
+            read = self._cas_ids().pop(key, None)
+            if read is not None and self._alive(key) is not read:
+                return False
+            self._data[key] = (val, self._expires(time))
+            return True
+
+    def set_multi(self, mapping, time=0):
+        with self._lock:
+            for key, val in mapping.items():
+                self._data[key] = (val, self._expires(time))
+            return []
+
+    def add(self, key, val, time=0):
+        with self._lock:
+            if self._alive(key) is not None:
+                return False
+            self._data[key] = (val, self._expires(time))
+            return True
+
+    def incr(self, key, delta=1):
+        with self._lock:
+            entry = self._alive(key)
+            if entry is None:
+                return None
+            val = int(entry[0]) + delta
+            self._data[key] = (val, entry[1])
+            return val
+
+    def delete(self, key, time=0):
+        with self._lock:
+            self._data.pop(key, None)
+            return 1
+
+    def flush_all(self):
+        with self._lock:
+            self._data.clear()
+
+    def _expires(self, timeout):
+        return time.time() + timeout if timeout else 0
+
+
+class LRUCache(object):
+    """Per-process cache holding at most maxsize entries, evicting the least
+    recently used, where each entry expires ttl seconds after being set.
+    """
+
+    def __init__(self, maxsize, ttl):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._data.pop(key, None)
+            if entry is None:
+                return None
+            if entry[1] < time.time():
+                return None
+            self._data[key] = entry
+            return entry[0]
+
+    def set(self, key, val):
+        with self._lock:
+            self._data.pop(key, None)
+            self._data[key] = (val, time.time() + self.ttl)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+
+def create_client():
+    servers = app.config.get('MEMCACHED_SERVERS')
+    if not servers:
+        return LocalClient()
+    return memcache.Client(servers, cache_cas=True)
+
+
+# Tests can swap this for a LocalClient
+client = create_client()
+
+
+def make_key(*parts):
+    key = u':'.join([app.config['CACHE_KEY_PREFIX']] + [unicode(part) for part in parts])
+    key = key.encode('utf-8')
+    if len(key) > 200 or ' ' in key:
+        key = '{0}:{1}'.format(app.config['CACHE_KEY_PREFIX'], hashlib.md5(key).hexdigest())
+    return key
+
+
+def get_version(namespace):
+    key = make_key('version', namespace)
+    version = client.get(key)
+    if version is None:
+
+        # start from the current time instead of 1, so a version key
+        # evicted from memcached can not resurrect stale values
+        client.add(key, int(time.time() * 1000))
+        version = client.get(key)
+    return version
+
+
+def bump_version(namespace):
+    key = make_key('version', namespace)
+    if client.incr(key) is None:
+        client.add(key, int(time.time() * 1000))
+
+
+def versioned_key(namespace, *parts):
+    return make_key(namespace, get_version(namespace), *parts)
+
+
+def get(key):
+    return client.get(key)
+
+
+def set(key, val, timeout=None):
+    if timeout is None:
+        timeout = app.config['CACHE_TIMEOUT']
+    return client.set(key, val, time=timeout)
+
+
+def hackathon_namespace(hackathon_id):
+    return u'hackathon:{0}'.format(hackathon_id)
+
+
+def user_namespace(user_id):
+    return u'user:{0}'.format(user_id)
+
+
+HACKATHONS_NAMESPACE = u'hackathons'
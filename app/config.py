@@ -57,7 +57,109 @@ COMPRESSOR_STATIC_PREFIX = '/static/sdist'
 
 USER_AGENT = 'hackathonrank/1.0.0'
 
+# WakaTime api client, override the base url to point at a fake server
+WAKATIME_BASE_URL = os.environ.get('WAKATIME_BASE_URL', 'https://wakatime.com')
+WAKATIME_POOL_SIZE = 10
+WAKATIME_CONNECT_TIMEOUT = 3.05
+WAKATIME_READ_TIMEOUT = 20
+WAKATIME_RETRIES = 3
+WAKATIME_BACKOFF_FACTOR = 0.5
+
+# calls per second to WakaTime from every process together, spaced evenly
+# by app.ratelimit.TokenBucketRateLimiter
+WAKATIME_RATE_LIMIT = 20
+
+# retries and read timeout for calls made while a web worker waits, so each
+# call blocks it for at most about 2 * (3.05 + 5) seconds instead of about 95
+WAKATIME_REQUEST_RETRIES = 1
+WAKATIME_REQUEST_READ_TIMEOUT = 5
+
+# seconds to wait for the rate limit in background jobs, and in requests
+# where a web worker is blocked while waiting
+WAKATIME_RATE_LIMIT_TIMEOUT = 30
+WAKATIME_RATE_LIMIT_REQUEST_TIMEOUT = 1
+
+# Leaderboards
+LEADERBOARD_PAGE_SIZE = 50
+LEADERBOARD_MAX_TOP = 1000
+
+# Ranks shown above and below the user's own by position.json, by default
+# and at most
+POSITION_NEIGHBOURS = 5
+POSITION_MAX_NEIGHBOURS = 50
+
+# Hackathons listed per index section, and how long the index is cached
+INDEX_PAGE_SIZE = 20
+INDEX_CACHE_TIMEOUT = 60
+
+# Larger top= values, or top=all, are streamed in batches of this many rows
+LEADERBOARD_STREAM_BATCH = 500
+
+# Memcached
+MEMCACHED_SERVERS = ['127.0.0.1:11211']
+CACHE_KEY_PREFIX = 'hackathonrank'
+CACHE_TIMEOUT = 60 * 60 * 24
+
+# Hackathon name lookups, cached per process
+HACKATHON_CACHE_SIZE = 10000
+HACKATHON_CACHE_TIMEOUT = 60
+
+# Logged in users, cached per process and optionally in memcached
+USER_CACHE_SIZE = 10000
+USER_CACHE_TIMEOUT = 60 * 5
+USER_CACHE_MEMCACHED = True
+
+# Sorted leaderboards for position lookups, see app.standings. Boards kept
+# per process, seconds a board or its memcached copy is kept, and ranks per
+# memcached chunk, which must stay under memcached's 1MB item size
+STANDINGS_CACHE_SIZE = 100
+STANDINGS_TIMEOUT = 60 * 10
+STANDINGS_CHUNK_SIZE = 5000
+
+# Ended hackathons are frozen into static leaderboard files in SNAPSHOT_DIR
+# after FINALIZE_DELAY, so late WakaTime data is still counted. With
+# SNAPSHOT_X_ACCEL nginx sends them from an internal location at SNAPSHOT_URL.
+# Files are written by the celery worker that finalizes, so with more than
+# one node SNAPSHOT_DIR must be a shared volume (for ex: NFS) mounted at the
+# same path on every web and worker node. Nodes without the files fall back
+# to rendering the final standings from the database.
+SNAPSHOT_DIR = os.path.join(BASE_DIR, 'snapshots')
+SNAPSHOT_URL = '/snapshots'
+SNAPSHOT_X_ACCEL = not DEV
+FINALIZE_DELAY = timedelta(days=1)
+
+# Request metrics, flushed to memcached for /metrics
+METRICS_BUCKETS = [0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10]
+METRICS_FLUSH_INTERVAL = 10
+
+# Celery
+BROKER_URL = 'amqp://guest@localhost//'
+CELERY_RESULT_BACKEND = 'cache+memcached://127.0.0.1:11211/'
+CELERY_TASK_RESULT_EXPIRES = 60 * 60
+CELERY_TASK_SERIALIZER = 'json'
+CELERY_RESULT_SERIALIZER = 'json'
+CELERY_ACCEPT_CONTENT = ['json']
+CELERY_ALWAYS_EAGER = DEV
+CELERYBEAT_SCHEDULE = {
+    'refresh-active-hackathons': {
+        'task': 'app.tasks.refresh_active_hackathons',
+        'schedule': timedelta(minutes=10),
+    },
+    'finalize-ended-hackathons': {
+        'task': 'app.tasks.finalize_ended_hackathons',
+        'schedule': timedelta(hours=1),
+    },
+}
+
+# Background refresh of participants during active hackathons
+REFRESH_BATCH_SIZE = 100
+REFRESH_CONCURRENCY = 8
+REFRESH_LOCK_TIMEOUT = 60 * 30
+
 ALEMBIC_CONFIG = os.path.join(BASE_DIR, 'alembic.ini')
+
+# PostgreSQL 9.5 or newer, for the INSERT ... ON CONFLICT upserts in
+# app.models, checked by benchmarks.upsert
 DB_HOST = 'localhost'
 DB_PORT = 5432
 DB_NAME = 'hackathonrank'
@@ -5,6 +5,14 @@
 
     Custom JSON Encoder and Decoder to support extra objects, including:
     datetime.time, datetime.date
+
+    The encoder looks up how to serialize an object by its exact type in
+    ENCODERS, instead of walking an isinstance chain for every value, and
+    remembers the strings it formatted for recent dates and times.
+
+    Flask's JSONEncoder extends simplejson when it is installed, so its C
+    speedups are used automatically; otherwise the standard library's json
+    module is used.
 """
 
 import datetime
@@ -12,21 +20,137 @@ import pytz
 import uuid
 from sqlalchemy.dialects.postgresql import UUID
 
-from flask.json import JSONEncoder, JSONDecoder
+from flask.json import JSONEncoder, JSONDecoder, _json
+
+
+# which json module is doing the encoding, simplejson or json
+backend = _json.__name__
+
+MAX_CACHED_TIMESTAMPS = 10000
+
+STREAM_CHUNK_SIZE = 8192
+
+# how many levels of dicts and lists iterencode splits into chunks, below
+# which values are encoded in one shot, by the C speedups when available
+STREAM_DEPTH = 2
+
+
+_formatted_datetimes = {}
+_formatted_dates = {}
+_formatted_times = {}
+
+
+def remember(formatted, o, value):
+    if len(formatted) >= MAX_CACHED_TIMESTAMPS:
+        formatted.clear()
+    formatted[o] = value
+    return value
+
+
+def encode_datetime(o):
+
+    # aware and naive datetimes can not be compared, so only cache naive ones
+    if o.tzinfo is not None:
+        o = o.astimezone(pytz.utc).replace(tzinfo=None)
+    try:
+        return _formatted_datetimes[o]
+    except KeyError:
+        value = '%04d-%02d-%02dT%02d:%02d:%02dZ' % (o.year, o.month, o.day, o.hour, o.minute, o.second)
+        return remember(_formatted_datetimes, o, value)
+
+
+def encode_time(o):
+    try:
+        return _formatted_times[o]
+    except KeyError:
+        return remember(_formatted_times, o, o.strftime('%I:%M%p').lstrip('0').lower())
+
+
+def encode_date(o):
+    try:
+        return _formatted_dates[o]
+    except KeyError:
+        return remember(_formatted_dates, o, '%02d/%02d/%04d' % (o.month, o.day, o.year))
+
+
+def encode_uuid(o):
+    return str(o)
+
+
+ENCODERS = {
+    datetime.datetime: encode_datetime,
+    datetime.time: encode_time,
+    datetime.date: encode_date,
+    uuid.UUID: encode_uuid,
+}
+
+
+# values of these types are already json compatible
+PRIMITIVE_TYPES = frozenset([str, unicode, int, long, float, bool, type(None)])
+
+
+def find_encoder(kind):
+    """Return the ENCODERS function for a type, or None.
+    """
+    encoder = ENCODERS.get(kind)
+    if encoder is not None:
+        return encoder
+
+    # subclasses of a supported type use the closest base class's encoder
+    for base in kind.__mro__[1:]:
+        encoder = ENCODERS.get(base)
+        if encoder is not None:
+            ENCODERS[kind] = encoder
+            return encoder
+    return None
+
+
+def to_primitive(o):
+    """Return o as the plain values loads(dumps(o)) would, converting types
+    in ENCODERS directly instead of encoding and parsing a string. Raises
+    TypeError for values that can not be serialized.
+    """
+    kind = type(o)
+    if kind in PRIMITIVE_TYPES:
+        return o
+    if kind in (list, tuple):
+        return [to_primitive(val) for val in o]
+    if kind is dict:
+        return _dict_to_primitive(o)
+
+    # subclasses, like OrderedDict, defaultdict and namedtuples, after the
+    # exact types above which cover almost every value
+    if isinstance(o, dict):
+        return _dict_to_primitive(o)
+    if isinstance(o, (list, tuple)):
+        if hasattr(o, '_asdict') and getattr(_compact_encoder, 'namedtuple_as_object', False):
+            return _dict_to_primitive(o._asdict())
+        return [to_primitive(val) for val in o]
+    encoder = find_encoder(kind)
+    if encoder is None:
+        raise TypeError('{0!r} is not JSON serializable'.format(o))
+    return encoder(o)
+
+
+def _dict_to_primitive(o):
+    converted = {}
+    for key, val in o.iteritems():
+        if not isinstance(key, basestring):
+            if type(key) not in PRIMITIVE_TYPES:
+                raise TypeError('{0!r} is not a valid json key'.format(key))
+            key = _compact_encoder.encode(key)
+        converted[key] = to_primitive(val)
+    return converted
 
 
 class CustomJSONEncoder(JSONEncoder):
 
     def default(self, o):
-        if isinstance(o, datetime.datetime):
-            if o.tzinfo is not None:
-                o = o.astimezone(pytz.utc)
-            return o.strftime('%Y-%m-%dT%H:%M:%SZ')
-        if isinstance(o, datetime.time):
-            return o.strftime('%I:%M%p').lstrip('0').lower()
-        if isinstance(o, datetime.date):
-            return o.strftime('%m/%d/%Y')
-        if isinstance(o, uuid.UUID) or isinstance(o, UUID):
+        encoder = find_encoder(type(o))
+        if encoder is not None:
+            return encoder(o)
+
+        if isinstance(o, UUID):
             return unicode(o)
         return JSONEncoder.default(self, o)
 
@@ -34,3 +158,58 @@ class CustomJSONEncoder(JSONEncoder):
 class CustomJSONDecoder(JSONDecoder):
     """This one does not change the default behavior.
     """
+
+
+_compact_encoder = CustomJSONEncoder(separators=(',', ':'))
+
+
+def dumps(obj):
+    """Serialize obj to a compact JSON string.
+    """
+    return _compact_encoder.encode(obj)
+
+
+def iterencode(obj, chunk_size=STREAM_CHUNK_SIZE):
+    """Serialize obj to compact JSON, yielding chunks of about chunk_size
+    characters, for streaming large responses without building the whole
+    string in memory first.
+
+    Usage::
+
+        >>> return Response(iterencode(data), mimetype='application/json')
+    """
+    buffered = []
+    size = 0
+    for part in _stream(obj, STREAM_DEPTH):
+        buffered.append(part)
+        size += len(part)
+        if size >= chunk_size:
+            yield ''.join(buffered)
+            buffered = []
+            size = 0
+    if buffered:
+        yield ''.join(buffered)
+
+
+def _stream(obj, depth):
+    """Yield the JSON for obj in parts, one per item of the outer depth
+    levels of dicts and lists.
+    """
+    encode = _compact_encoder.encode
+    if depth and type(obj) is dict and all(isinstance(key, basestring) for key in obj):
+        yield '{'
+        for i, (key, val) in enumerate(obj.iteritems()):
+            yield (',' if i else '') + encode(key) + ':'
+            for part in _stream(val, depth - 1):
+                yield part
+        yield '}'
+    elif depth and type(obj) in (list, tuple):
+        yield '['
+        for i, val in enumerate(obj):
+            if i:
+                yield ','
+            for part in _stream(val, depth - 1):
+                yield part
+        yield ']'
+    else:
+        yield encode(obj)
@@ -0,0 +1,208 @@
+# -*- coding: utf-8 -*-
+"""
+    hackathonranks.metrics
+    ~~~~~~~~~~~~~~~~~~~~~~
+
+    Per request instrumentation of SQL queries and outbound http calls.
+
+    Each request's query count, database time, http call count and http
+    time are written to the uwsgi request log as logvars, and added up per
+    endpoint. Every process keeps its totals in memory and adds them to
+    shared counters in memcached at most every METRICS_FLUSH_INTERVAL
+    seconds, so /metrics reports all workers on all nodes in Prometheus
+    text format.
+"""
+
+
+import threading
+import time
+from collections import defaultdict
+
+from flask import Blueprint, g, has_app_context, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+from app import app, cache
+from app.querybudget import query_budget
+from app.utils import uwsgi
+
+
+PREFIX = 'hackathonranks'
+
+# stored in memcached as integer microseconds, because incr only adds ints
+MICROSECONDS = 1000000
+
+COUNTERS = [
+    ('requests_total', 'Requests handled.'),
+    ('db_queries_total', 'SQL statements executed while handling requests.'),
+    ('db_seconds_total', 'Time spent executing SQL statements.'),
+    ('http_requests_total', 'Outbound http calls made while handling requests.'),
+    ('http_seconds_total', 'Time spent in outbound http calls.'),
+]
+
+
+class RequestMetrics(object):
+    """Counters for the request being handled, kept on flask.g.
+    """
+
+    def __init__(self):
+        self.started = time.time()
+        self.db_queries = 0
+        self.db_seconds = 0.0
+        self.http_requests = 0
+        self.http_seconds = 0.0
+
+
+class Registry(object):
+    """This process's totals per endpoint since they were last flushed to
+    memcached.
+    """
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self._deltas = defaultdict(int)
+        self._lock = threading.Lock()
+        self._flushed_at = time.time()
+
+    def observe(self, endpoint, duration, metrics):
+        bucket = len(self.buckets)
+        for i, le in enumerate(self.buckets):
+            if duration <= le:
+                bucket = i
+                break
+        with self._lock:
+            deltas = self._deltas
+            deltas[('bucket', endpoint, bucket)] += 1
+            deltas[('duration_sum', endpoint)] += int(duration * MICROSECONDS)
+            deltas[('requests_total', endpoint)] += 1
+            deltas[('db_queries_total', endpoint)] += metrics.db_queries
+            deltas[('db_seconds_total', endpoint)] += int(metrics.db_seconds * MICROSECONDS)
+            deltas[('http_requests_total', endpoint)] += metrics.http_requests
+            deltas[('http_seconds_total', endpoint)] += int(metrics.http_seconds * MICROSECONDS)
+
+    def maybe_flush(self):
+        if time.time() - self._flushed_at >= app.config['METRICS_FLUSH_INTERVAL']:
+            self.flush()
+
+    def flush(self):
+        with self._lock:
+            deltas = self._deltas
+            self._deltas = defaultdict(int)
+            self._flushed_at = time.time()
+        for series, delta in deltas.items():
+            if not delta:
+                continue
+            key = series_key(series)
+            if cache.client.incr(key, delta) is None and not cache.client.add(key, delta, time=0):
+                cache.client.incr(key, delta)
+
+
+registry = Registry(app.config['METRICS_BUCKETS'])
+
+
+def series_key(series):
+    return cache.make_key('metrics', *series)
+
+
+def current():
+    """Return the RequestMetrics for the current request, or None outside
+    of one.
+    """
+    if not has_app_context():
+        return None
+    return getattr(g, 'request_metrics', None)
+
+
+def record_http(seconds):
+    """Called by app.wakatime for each outbound http call.
+    """
+    metrics = current()
+    if metrics is not None:
+        metrics.http_requests += 1
+        metrics.http_seconds += seconds
+
+
+@event.listens_for(Engine, 'before_cursor_execute')
+def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info['query_started'] = time.time()
+
+
+@event.listens_for(Engine, 'after_cursor_execute')
+def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    started = conn.info.pop('query_started', None)
+    metrics = current()
+    if metrics is not None and started is not None:
+        metrics.db_queries += 1
+        metrics.db_seconds += time.time() - started
+
+
+@app.before_request
+def start_request_metrics():
+    g.request_metrics = RequestMetrics()
+
+
+@app.teardown_request
+def finish_request_metrics(exc):
+    metrics = getattr(g, 'request_metrics', None)
+    if metrics is None:
+        return
+    duration = time.time() - metrics.started
+
+    uwsgi.set_logvar('db_queries', str(metrics.db_queries))
+    uwsgi.set_logvar('db_ms', str(int(metrics.db_seconds * 1000)))
+    uwsgi.set_logvar('http_calls', str(metrics.http_requests))
+    uwsgi.set_logvar('http_ms', str(int(metrics.http_seconds * 1000)))
+
+    registry.observe(request.endpoint or 'none', duration, metrics)
+    registry.maybe_flush()
+
+
+blueprint = Blueprint('metrics', __name__)
+
+
+@blueprint.route('/metrics')
+@query_budget(0)
+def export():
+    """Totals from every process in Prometheus text format.
+    """
+    registry.flush()
+
+    endpoints = sorted(set(rule.endpoint for rule in app.url_map.iter_rules()) | set(['none']))
+    buckets = registry.buckets
+    series = []
+    for endpoint in endpoints:
+        series.append(('duration_sum', endpoint))
+        series.extend(('bucket', endpoint, i) for i in range(len(buckets) + 1))
+        series.extend((name, endpoint) for name, _ in COUNTERS)
+    keys = dict((series_key(s), s) for s in series)
+    found = cache.client.get_multi(keys.keys())
+    values = dict((keys[key], int(val)) for key, val in found.items())
+
+    name = '{0}_request_duration_seconds'.format(PREFIX)
+    lines = [
+        '# HELP {0} Time to handle requests, per endpoint.'.format(name),
+        '# TYPE {0} histogram'.format(name),
+    ]
+    for endpoint in endpoints:
+        if not values.get(('requests_total', endpoint)):
+            continue
+        cumulative = 0
+        for i, le in enumerate(list(buckets) + ['+Inf']):
+            cumulative += values.get(('bucket', endpoint, i), 0)
+            lines.append('{0}_bucket{{endpoint="{1}",le="{2}"}} {3}'.format(name, endpoint, le, cumulative))
+        lines.append('{0}_sum{{endpoint="{1}"}} {2}'.format(name, endpoint, values.get(('duration_sum', endpoint), 0) / float(MICROSECONDS)))
+        lines.append('{0}_count{{endpoint="{1}"}} {2}'.format(name, endpoint, cumulative))
+
+    for counter, help_text in COUNTERS:
+        name = '{0}_{1}'.format(PREFIX, counter)
+        lines.append('# HELP {0} {1}'.format(name, help_text))
+        lines.append('# TYPE {0} counter'.format(name))
+        for endpoint in endpoints:
+            if not values.get(('requests_total', endpoint)):
+                continue
+            val = values.get((counter, endpoint), 0)
+            if counter.endswith('_seconds_total'):
+                val = val / float(MICROSECONDS)
+            lines.append('{0}{{endpoint="{1}"}} {2}'.format(name, endpoint, val))
+
+    return app.response_class('\n'.join(lines) + '\n', mimetype='text/plain; version=0.0.4')
@@ -9,17 +9,23 @@
 
 from __future__ import division
 
+import inspect
 import math
+import pytz
 import uuid
-from datetime import datetime
-from sqlalchemy import not_
+from collections import namedtuple
+from datetime import datetime, timedelta
+from sqlalchemy import event, not_, select, tuple_
 from sqlalchemy.dialects.postgresql import UUID
 from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.compiler import compiles
+from sqlalchemy.orm.attributes import get_history
+from sqlalchemy.sql.expression import ClauseElement, Executable
 
-from app import app
+from app import app, cache
+from app import json as app_json
 
-from flask import json
-from flask.ext.sqlalchemy import SQLAlchemy
+from flask.ext.sqlalchemy import SQLAlchemy, SignallingSession
 
 
 # Setup Database
@@ -27,10 +33,84 @@ db = SQLAlchemy(app)
 
 
 
+""" Upsert
+"""
+
+
+EXCLUDED = object()
+
+
+class Upsert(Executable, ClauseElement):
+    """INSERT ... ON CONFLICT (conflict_fields) DO UPDATE ... RETURNING,
+    which needs PostgreSQL 9.5 or newer. benchmarks.upsert checks it.
+
+    update maps column names to either EXCLUDED, to take the value from
+    the row being inserted, or a value to set.
+    """
+
+    def __init__(self, insert, conflict_fields, update, returning):
+        self.insert = insert
+        self.conflict_fields = conflict_fields
+        self.update = update
+        self.returning = returning
+
+
+@compiles(Upsert)
+def compile_upsert(element, compiler, **kwargs):
+    insert = compiler.process(element.insert, **kwargs)
+
+    # run as a plain statement returning rows, not as an insert
+    compiler.isinsert = False
+
+    # bind params must be processed in statement order, for positional
+    # paramstyles
+    quote = compiler.preparer.quote
+    assignments = []
+    for key in sorted(element.update):
+        value = element.update[key]
+        if value is EXCLUDED:
+            assignments.append('{0} = EXCLUDED.{0}'.format(quote(key)))
+        else:
+            assignments.append('{0} = {1}'.format(quote(key), compiler.process(db.bindparam(key + '_upsert', value), **kwargs)))
+
+    # labeled like select columns, so rows get the columns' result types
+    returning = [compiler._label_select_column(None, column, True, False, {}) for column in element.returning]
+
+    return '{insert} ON CONFLICT ({conflict}) DO UPDATE SET {assignments} RETURNING {returning}'.format(
+        insert=insert,
+        conflict=', '.join(quote(field) for field in element.conflict_fields),
+        assignments=', '.join(assignments),
+        returning=', '.join(returning),
+    )
+
+
 """ Base Model
 """
 
 
+# to_dict output plans, keyed by model class and to_dict arguments
+SerializationPlan = namedtuple('SerializationPlan', ['columns', 'relationships', 'properties'])
+_serialization_plans = {}
+MAX_SERIALIZATION_PLANS = 10000
+
+# _set_columns write plans, keyed by model class
+WritePlan = namedtuple('WritePlan', ['columns', 'relationships', 'writable', 'timestamps'])
+_write_plans = {}
+
+ALWAYS_READONLY_FIELDS = frozenset([
+    'id',
+    'created',
+    'updated',
+    'modified',
+    'created_at',
+    'updated_at',
+    'modified_at',
+])
+
+# set to the current time by set_columns
+TIMESTAMP_FIELDS = ('modified', 'updated', 'modified_at', 'updated_at')
+
+
 class Model(db.Model):
     """Base SQLAlchemy Model for automatic serialization and
     deserialization of columns and nested relationships.
@@ -70,17 +150,19 @@ class Model(db.Model):
     """
     __abstract__ = True
 
-    # Stores changes made to this model's attributes. Can be retrieved
-    # with model.get_changes()
-    _changes = {}
-
     def __init__(self, **kwargs):
         kwargs['_force'] = True
         self._set_columns(**kwargs)
 
     @classmethod
-    def _get_or_create(cls, defaults={}, **kwargs):
+    def _get_or_create(cls, defaults={}, for_update=False, **kwargs):
+        """Return (instance, created). With for_update the existing row is
+        locked and reloaded until the transaction ends, so its committed
+        values can be read then changed without racing other writers.
+        """
         query = db.session.query(cls).filter_by(**kwargs)
+        if for_update:
+            query = query.with_for_update().populate_existing()
 
         instance = query.first()
         if instance is not None:
@@ -102,89 +184,166 @@ class Model(db.Model):
             return instance, False
 
     @classmethod
-    def get_or_create(cls, defaults={}, **kwargs):
-        return cls._get_or_create(defaults=defaults, **kwargs)[0]
+    def get_or_create(cls, defaults={}, for_update=False, **kwargs):
+        return cls._get_or_create(defaults=defaults, for_update=for_update, **kwargs)[0]
+
+    @classmethod
+    def upsert_many(cls, rows, conflict_fields=None, update_fields=None):
+        """Insert rows, updating the existing row instead when one conflicts
+        on conflict_fields, using one INSERT ... ON CONFLICT DO UPDATE ...
+        RETURNING statement. Returns the resulting instances in the same
+        order as rows.
+
+        conflict_fields defaults to the model's conflict_fields and must
+        match a unique constraint. update_fields defaults to every given
+        field except conflict and readonly fields.
+        """
+        if not rows:
+            return []
+        if conflict_fields is None:
+            conflict_fields = cls.conflict_fields
+        table = cls.__table__
+
+        # fill python side defaults here, because multi row inserts
+        # would share one default value between all rows
+        fields = set()
+        for row in rows:
+            fields.update(row.keys())
+        if update_fields is None:
+            update_fields = fields - set(conflict_fields) - ALWAYS_READONLY_FIELDS
+        values = []
+        for row in rows:
+            row = dict(row)
+            for column in table.columns:
+                if column.key not in row and column.default is not None:
+                    if column.default.is_callable:
+                        row[column.key] = column.default.arg(None)
+                    else:
+                        row[column.key] = column.default.arg
+            values.append(row)
+        fields = set()
+        for row in values:
+            fields.update(row.keys())
+        for row in values:
+            for key in fields:
+                row.setdefault(key, None)
+
+        # conflicting rows are only returned when they are updated
+        update = {}
+        for key in update_fields or conflict_fields[:1]:
+            update[key] = EXCLUDED
+        now = datetime.utcnow()
+        for key in TIMESTAMP_FIELDS:
+            if key in table.columns:
+                update[key] = now
+
+        stmt = Upsert(table.insert().values(values), conflict_fields, update, table.columns)
+        result = db.session.execute(stmt)
+        instances = list(db.session.query(cls).populate_existing().instances(result))
+
+        # bulk statements skip the session's change tracking
+        for instance in instances:
+            bulk_changed(instance)
+
+        key = lambda obj: tuple(unicode(getattr(obj, field)) for field in conflict_fields)
+        by_key = dict((key(instance), instance) for instance in instances)
+        return [by_key[tuple(unicode(row[field]) for field in conflict_fields)] for row in values]
+
+    @classmethod
+    def upsert(cls, conflict_fields=None, update_fields=None, **kwargs):
+        """Insert or update one row, see upsert_many.
+        """
+        return cls.upsert_many([kwargs], conflict_fields=conflict_fields, update_fields=update_fields)[0]
+
+    @classmethod
+    def _write_plan(cls):
+        """Return which columns and relationships _set_columns may write,
+        computed once per model class then cached.
+        """
+        plan = _write_plans.get(cls)
+        if plan is not None:
+            return plan
+
+        readonly = set(ALWAYS_READONLY_FIELDS)
+        readonly.update(getattr(cls, 'readonly_fields', []))
+        readonly.update(getattr(cls, 'hidden_fields', []))
+
+        columns = tuple(cls.__table__.columns.keys())
+        relationships = tuple(cls.__mapper__.relationships.keys())
+        plan = WritePlan(
+            columns=columns,
+            relationships=relationships,
+            writable=frozenset(columns + relationships) - readonly,
+            timestamps=tuple(key for key in TIMESTAMP_FIELDS if key in columns),
+        )
+        _write_plans[cls] = plan
+        return plan
 
     def _set_columns(self, **kwargs):
 
         # TODO: stop traversing objects when no more data available
 
         force = kwargs.get('_force')
-
-        readonly = []
-        if hasattr(self, 'readonly_fields'):
-            readonly = self.readonly_fields
-        if hasattr(self, 'hidden_fields'):
-            readonly += self.hidden_fields
-
-        readonly += [
-            'id',
-            'created',
-            'updated',
-            'modified',
-            'created_at',
-            'updated_at',
-            'modified_at',
-        ]
+        plan = self._write_plan()
+        writable = plan.writable
 
         changes = {}
 
-        columns = self.__table__.columns.keys()
-        relationships = self.__mapper__.relationships.keys()
-
-        for key in columns:
-            allowed = True if force or key not in readonly else False
-            exists = True if key in kwargs else False
-            if allowed and exists:
+        for key in plan.columns:
+            if key in kwargs and (force or key in writable):
                 val = getattr(self, key)
                 if val != kwargs[key]:
                     changes[key] = {'old': val, 'new': kwargs[key]}
                     setattr(self, key, kwargs[key])
 
-        for rel in relationships:
-            allowed = True if force or rel not in readonly else False
-            exists = True if rel in kwargs else False
-            if allowed and exists:
+        for rel in plan.relationships:
+            if rel in kwargs and (force or rel in writable):
                 is_list = self.__mapper__.relationships[rel].uselist
                 if is_list:
                     valid_ids = []
                     query = getattr(self, rel)
-                    cls = self.__mapper__.relationships[rel].argument()
+                    cls = self.__mapper__.relationships[rel].mapper.class_
+
+                    # load every referenced row with one query
+                    ids = [item['id'] for item in kwargs[rel] if 'id' in item]
+                    existing = {}
+                    if ids:
+                        for obj in query.filter(cls.id.in_(ids)):
+                            existing[str(obj.id)] = obj
+
+                    # new rows get ids when they are flushed, all at once
+                    created = []
                     for item in kwargs[rel]:
-                        if 'id' in item and query.filter_by(id=item['id']).limit(1).count() == 1:
-                            obj = cls.query.filter_by(id=item['id']).first()
+                        obj = existing.get(str(item['id'])) if 'id' in item else None
+                        if obj is not None:
                             col_changes = obj.set_columns(**item)
                             if col_changes:
                                 col_changes['id'] = str(item['id'])
-                                if rel in changes:
-                                    changes[rel].append(col_changes)
-                                else:
-                                    changes.update({rel: [col_changes]})
+                                changes.setdefault(rel, []).append(col_changes)
                             valid_ids.append(str(item['id']))
                         else:
                             col = cls()
                             col_changes = col.set_columns(**item)
                             query.append(col)
-                            db.session.flush()
+                            if col_changes:
+                                changes.setdefault(rel, []).append(col_changes)
+                            created.append((col, col_changes))
+                    if created:
+                        db.session.flush()
+                        for col, col_changes in created:
                             if col_changes:
                                 col_changes['id'] = str(col.id)
-                                if rel in changes:
-                                    changes[rel].append(col_changes)
-                                else:
-                                    changes.update({rel: [col_changes]})
                             valid_ids.append(str(col.id))
 
                     # delete related rows that were not in kwargs[rel]
-                    for item in query.filter(not_(cls.id.in_(valid_ids))).all():
-                        col_changes = {
-                            'id': str(item.id),
+                    # delete related rows that were not in kwargs[rel] through
+                    # the session, so flush listeners and cascades see them
+                    for obj in query.filter(not_(cls.id.in_(valid_ids))):
+                        changes.setdefault(rel, []).append({
+                            'id': str(obj.id),
                             'deleted': True,
-                        }
-                        if rel in changes:
-                            changes[rel].append(col_changes)
-                        else:
-                            changes.update({rel: [col_changes]})
-                        db.session.delete(item)
+                        })
+                        db.session.delete(obj)
 
                 else:
                     # TODO: lazyily create related row if does not exist
@@ -204,18 +363,18 @@ class Model(db.Model):
 
     def set_columns(self, **kwargs):
         self._changes = self._set_columns(**kwargs)
-        if 'modified' in self.__table__.columns:
-            self.modified = datetime.utcnow()
-        if 'updated' in self.__table__.columns:
-            self.updated = datetime.utcnow()
-        if 'modified_at' in self.__table__.columns:
-            self.modified_at = datetime.utcnow()
-        if 'updated_at' in self.__table__.columns:
-            self.updated_at = datetime.utcnow()
+        timestamps = self._write_plan().timestamps
+        if timestamps:
+            now = datetime.utcnow()
+            for key in timestamps:
+                setattr(self, key, now)
         return self._changes
 
     def get_changes(self):
-        return self._changes
+        """Return changes made by the last set_columns call on this
+        instance.
+        """
+        return self.__dict__.get('_changes', {})
 
     def reset_changes(self):
         self._changes = {}
@@ -230,12 +389,6 @@ class Model(db.Model):
             show = []
         if not hide:
             hide = []
-        hidden = []
-        if hasattr(self, 'hidden_fields'):
-            hidden = self.hidden_fields
-        default = []
-        if hasattr(self, 'default_fields'):
-            default = self.default_fields
 
         ret_data = {}
 
@@ -254,66 +407,244 @@ class Model(db.Model):
             show[:] = [prepend_path(x) for x in show]
             hide[:] = [prepend_path(x) for x in hide]
 
-        columns = self.__table__.columns.keys()
-        relationships = self.__mapper__.relationships.keys()
-        properties = dir(self)
-
-        for key in columns:
-            check = '%s.%s' % (path, key)
-            if check in hide or key in hidden:
-                continue
-            if show_all or key is 'id' or check in show or key in default:
+        plan = self._serialization_plan(path, show, hide, show_all)
+
+        for key in plan.columns:
+            ret_data[key] = getattr(self, key)
+
+        for key, check, is_list, is_dynamic, is_nested in plan.relationships:
+            hide.append(check)
+            child_path = '%s.%s' % (path, key.lower())
+            if is_list:
+                ret_data[key] = []
+                items = getattr(self, key)
+                if is_dynamic:
+                    items = items.all()
+                for item in items:
+                    ret_data[key].append(item.to_dict(
+                        show=show,
+                        hide=hide,
+                        path=child_path,
+                        show_all=show_all,
+                    ))
+            elif is_nested:
+                item = getattr(self, key)
+                if item is not None:
+                    ret_data[key] = item.to_dict(
+                        show=show,
+                        hide=hide,
+                        path=child_path,
+                        show_all=show_all,
+                    )
+                else:
+                    ret_data[key] = None
+            else:
                 ret_data[key] = getattr(self, key)
 
-        for key in relationships:
-            check = '%s.%s' % (path, key)
-            if check in hide or key in hidden:
+        for key in plan.properties:
+            val = getattr(self, key)
+            if type(val) in app_json.PRIMITIVE_TYPES:
+                ret_data[key] = val
                 continue
-            if show_all or check in show or key in default:
-                hide.append(check)
-                is_list = self.__mapper__.relationships[key].uselist
-                if is_list:
-                    ret_data[key] = []
-                    if self.__mapper__.relationships[key].query_class is not None:
-                        items = getattr(self, key).all()
-                    else:
-                        items = getattr(self, key)
-                    for item in items:
-                        ret_data[key].append(item.to_dict(
-                            show=show,
-                            hide=hide,
-                            path=('%s.%s' % (path, key.lower())),
-                            show_all=show_all,
-                        ))
-                else:
-                    if self.__mapper__.relationships[key].query_class is not None or self.__mapper__.relationships[key].instrument_class is not None:
-                        item = getattr(self, key)
-                        if item is not None:
-                            ret_data[key] = item.to_dict(
-                                show=show,
-                                hide=hide,
-                                path=('%s.%s' % (path, key.lower())),
-                                show_all=show_all,
-                            )
-                        else:
-                            ret_data[key] = None
-                    else:
-                        ret_data[key] = getattr(self, key)
+            try:
+                ret_data[key] = app_json.to_primitive(val)
+            except TypeError:
+                pass
 
-        for key in list(set(properties) - set(columns) - set(relationships)):
-            if key.startswith('_'):
-                continue
+        return ret_data
+
+    @classmethod
+    def _serialization_plan(cls, path, show, hide, show_all):
+        """Return which columns, relationships and properties to_dict
+        outputs for these arguments, computed once per model class and
+        arguments then cached.
+        """
+        plan_key = (cls, path, tuple(show), tuple(hide), bool(show_all))
+        plan = _serialization_plans.get(plan_key)
+        if plan is not None:
+            return plan
+
+        show = frozenset(show)
+        hide = frozenset(hide)
+        hidden = frozenset(getattr(cls, 'hidden_fields', []))
+        default = frozenset(getattr(cls, 'default_fields', []))
+
+        def included(key, always=False):
             check = '%s.%s' % (path, key)
             if check in hide or key in hidden:
+                return False
+            return bool(show_all or always or check in show or key in default)
+
+        columns = cls.__table__.columns.keys()
+        relationships = cls.__mapper__.relationships
+
+        plan_relationships = []
+        for key in relationships.keys():
+            if included(key):
+                rel = relationships[key]
+                plan_relationships.append((
+                    key,
+                    '%s.%s' % (path, key),
+                    rel.uselist,
+                    rel.query_class is not None,
+                    rel.query_class is not None or rel.instrument_class is not None,
+                ))
+
+        # methods and attributes of the base Model are never serializable
+        properties = []
+        for key in set(dir(cls)) - set(dir(Model)) - set(columns) - set(relationships.keys()):
+            if key.startswith('_') or inspect.isroutine(getattr(cls, key, None)):
                 continue
-            if show_all or check in show or key in default:
-                val = getattr(self, key)
-                try:
-                    ret_data[key] = json.loads(json.dumps(val))
-                except:
-                    pass
+            if included(key):
+                properties.append(key)
 
-        return ret_data
+        plan = SerializationPlan(
+            columns=tuple(key for key in columns if included(key, always=(key == 'id'))),
+            relationships=tuple(plan_relationships),
+            properties=tuple(properties),
+        )
+        if len(_serialization_plans) >= MAX_SERIALIZATION_PLANS:
+            _serialization_plans.clear()
+        _serialization_plans[plan_key] = plan
+        return plan
+
+
+""" Helpers
+"""
+
+
+def format_coding_time(total_seconds):
+    hours = int(math.floor(total_seconds / 3600.0))
+    minutes = int(math.floor(total_seconds / 60.0)) % 60
+    seconds = total_seconds % 60
+    coding_time = ''
+    if hours > 0:
+        plural = 's' if hours != 1 else ''
+        coding_time = '{0} hour{1} '.format(hours, plural)
+    if minutes > 0:
+        plural = 's' if minutes != 1 else ''
+        coding_time = '{0}{1} minute{2} '.format(coding_time, minutes, plural)
+    plural = 's' if seconds != 1 else ''
+    coding_time = '{0}{1} second{2} '.format(coding_time, seconds, plural)
+    return coding_time
+
+
+class LeaderboardRow(namedtuple('LeaderboardRow', [
+    'id',
+    'user_id',
+    'hackathon_id',
+    'total_seconds',
+    'full_name',
+    'username',
+    'profile_url',
+    'avatar_url',
+])):
+    """Read-only leaderboard entry: a rank plus its user's display columns,
+    loaded in one joined query instead of a Rank and a lazy loaded User.
+    """
+    __slots__ = ()
+
+    @property
+    def coding_time(self):
+        return format_coding_time(self.total_seconds)
+
+    @property
+    def cursor(self):
+        return u'{0},{1}'.format(self.total_seconds, self.id)
+
+
+class RankedRow(namedtuple('RankedRow', LeaderboardRow._fields + (
+    'position',
+    'participants_count',
+))):
+    """Read-only leaderboard entry with its place in the hackathon, where
+    tied ranks share a place, and the number of participants.
+    """
+    __slots__ = ()
+
+    @property
+    def coding_time(self):
+        return format_coding_time(self.total_seconds)
+
+
+class Standing(namedtuple('Standing', [
+    'hackathon_id',
+    'name',
+    'coding_starts_at',
+    'coding_ends_at',
+    'total_seconds',
+    'position',
+    'participants_count',
+])):
+    """Read-only place of one user in one hackathon, for their dashboard.
+    """
+    __slots__ = ()
+
+    @property
+    def coding_time(self):
+        return format_coding_time(self.total_seconds)
+
+    def is_active(self, now=None):
+        if now is None:
+            now = datetime.utcnow()
+        return self.coding_starts_at <= now <= self.coding_ends_at
+
+
+class HackathonRef(namedtuple('HackathonRef', [
+    'id',
+    'name',
+    'coding_starts_at',
+    'coding_ends_at',
+    'timezone',
+    'finalized_at',
+])):
+    """Read-only hackathon columns needed to route a request, returned by
+    Hackathon.resolve from a per-process cache.
+    """
+    __slots__ = ()
+
+    def is_active(self, now=None):
+        if now is None:
+            now = datetime.utcnow()
+        return self.coding_starts_at <= now <= self.coding_ends_at
+
+    def has_ended(self, now=None):
+        if now is None:
+            now = datetime.utcnow()
+        return self.coding_ends_at < now
+
+
+class HackathonSummary(namedtuple('HackathonSummary', [
+    'id',
+    'name',
+    'coding_starts_at',
+    'coding_ends_at',
+    'participants_count',
+    'total_seconds',
+])):
+    """Read-only hackathon listing entry, with the denormalized counters
+    instead of aggregating ranks.
+    """
+    __slots__ = ()
+
+    @property
+    def total_hours(self):
+        return int(round(self.total_seconds / 3600))
+
+    @property
+    def cursor(self):
+        return u'{0},{1}'.format(self.coding_starts_at.strftime(CURSOR_DATETIME_FORMAT), self.id)
+
+
+CURSOR_DATETIME_FORMAT = '%Y-%m-%dT%H:%M:%S.%f'
+
+
+# HackathonRefs by name. Cleared when this process commits a hackathon
+# change, other processes' changes are seen after HACKATHON_CACHE_TIMEOUT
+hackathon_refs = cache.LRUCache(
+    maxsize=app.config['HACKATHON_CACHE_SIZE'],
+    ttl=app.config['HACKATHON_CACHE_TIMEOUT'],
+)
 
 
 """ Database Models
@@ -336,6 +667,8 @@ class User(Model):
     created_at = db.Column(db.DateTime(), nullable=False, default=datetime.utcnow)
     modified_at = db.Column(db.DateTime(), onupdate=datetime.utcnow)
 
+    conflict_fields = ['wakatime_id']
+
     def __repr__(self):
         return u'User({id})'.format(
             id=self.id,
@@ -357,19 +690,203 @@ class User(Model):
 class Hackathon(Model):
     id = db.Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
     admin_id = db.Column(UUID(as_uuid=True), db.ForeignKey('user.id'), nullable=False, index=True)
-    name = db.Column(db.String(100), nullable=False)
+    name = db.Column(db.String(100), nullable=False, unique=True, index=True)
     coding_starts_at = db.Column(db.DateTime(), nullable=False)
     coding_ends_at = db.Column(db.DateTime(), nullable=False)
     timezone = db.Column(db.String(200), nullable=False)
     ranks = db.relationship('Rank', backref='hackathon', lazy='dynamic')
+    participants_count = db.Column(db.Integer(), nullable=False, default=0)
+    total_seconds = db.Column(db.BigInteger(), nullable=False, default=0)
+    finalized_at = db.Column(db.DateTime())
     created_at = db.Column(db.DateTime(), nullable=False, default=datetime.utcnow)
     modified_at = db.Column(db.DateTime(), onupdate=datetime.utcnow)
 
+    # kept up to date from ranks by add_to_counters, and set by
+    # app.snapshots.finalize
+    readonly_fields = ['participants_count', 'total_seconds', 'finalized_at']
+
+    LISTING_SECTIONS = ('active', 'upcoming', 'past')
+
     def __repr__(self):
         return u'{name}'.format(
             name=self.name,
         )
 
+    @classmethod
+    def resolve(cls, name):
+        """Return a HackathonRef for the hackathon with this name, or None.
+        Only found hackathons are cached, so new ones resolve right away.
+        """
+        ref = hackathon_refs.get(name)
+        if ref is None:
+            row = db.session.query(
+                cls.id,
+                cls.name,
+                cls.coding_starts_at,
+                cls.coding_ends_at,
+                cls.timezone,
+                cls.finalized_at,
+            ).filter(cls.name == name).first()
+            if row is None:
+                return None
+            ref = HackathonRef(*row)
+            hackathon_refs.set(name, ref)
+        return ref
+
+    @classmethod
+    def listing(cls, section, limit=None, after=None, now=None):
+        """Return HackathonSummaries for one of LISTING_SECTIONS, paged with a
+        keyset cursor (coding_starts_at, id) of the last row from the
+        previous page. Upcoming hackathons are listed soonest first, active
+        and past ones most recent first.
+        """
+        if now is None:
+            now = datetime.utcnow()
+        query = db.session.query(
+            cls.id,
+            cls.name,
+            cls.coding_starts_at,
+            cls.coding_ends_at,
+            cls.participants_count,
+            cls.total_seconds,
+        )
+        key = tuple_(cls.coding_starts_at, cls.id)
+        if after is not None:
+            after = tuple_(
+                db.bindparam('after_starts_at', after[0], type_=cls.coding_starts_at.type),
+                db.bindparam('after_id', after[1], type_=cls.id.type),
+            )
+
+        if section == 'upcoming':
+            query = query.filter(cls.coding_starts_at > now)
+            if after is not None:
+                query = query.filter(key > after)
+            query = query.order_by(cls.coding_starts_at, cls.id)
+        else:
+            if section == 'active':
+                query = query.filter(cls.coding_starts_at <= now, cls.coding_ends_at >= now)
+            else:
+                query = query.filter(cls.coding_ends_at < now)
+            if after is not None:
+                query = query.filter(key < after)
+            query = query.order_by(cls.coding_starts_at.desc(), cls.id.desc())
+
+        if limit is not None:
+            query = query.limit(limit)
+        return [HackathonSummary(*row) for row in query]
+
+    @staticmethod
+    def parse_cursor(cursor):
+        """Parse a `<coding_starts_at>,<id>` cursor string, returning None
+        when it is missing or malformed.
+        """
+        if not cursor:
+            return None
+        try:
+            starts_at, hackathon_id = cursor.split(',', 1)
+            return datetime.strptime(starts_at, CURSOR_DATETIME_FORMAT), uuid.UUID(hackathon_id)
+        except ValueError:
+            return None
+
+    @classmethod
+    def update_counters(cls, hackathon_ids, session=None):
+        """Recount participants_count and total_seconds from the ranks of
+        these hackathons, with one UPDATE statement. Reads every rank, so
+        it only runs after a scheduled refresh, to correct any drift in the
+        increments from add_to_counters.
+        """
+        if not hackathon_ids:
+            return
+        if session is None:
+            session = db.session
+        rank = Rank.__table__
+        participants_count = select([db.func.count(rank.c.id)]).where(
+            rank.c.hackathon_id == cls.id,
+        ).as_scalar()
+        total_seconds = select([db.func.coalesce(db.func.sum(rank.c.total_seconds), 0)]).where(
+            rank.c.hackathon_id == cls.id,
+        ).as_scalar()
+        session.execute(cls.__table__.update().where(cls.id.in_(list(hackathon_ids))).values(
+            participants_count=participants_count,
+            total_seconds=total_seconds,
+        ))
+
+        # the index page and leaderboards show these counters
+        namespaces = session.info.setdefault('changed_namespaces', set())
+        namespaces.add(cache.HACKATHONS_NAMESPACE)
+        namespaces.update(cache.hackathon_namespace(hackathon_id) for hackathon_id in hackathon_ids)
+
+    @classmethod
+    def add_to_counters(cls, deltas, session=None):
+        """Add {hackathon_id: (participants, seconds)} to the counters of
+        these hackathons, in place so concurrent writers never overwrite
+        each other's changes. See counters_changed_on_commit.
+        """
+        if session is None:
+            session = db.session
+        table = cls.__table__
+        changed = False
+        for hackathon_id, (participants, seconds) in deltas.items():
+            if not participants and not seconds:
+                continue
+            session.execute(table.update().where(table.c.id == hackathon_id).values(
+                participants_count=table.c.participants_count + participants,
+                total_seconds=table.c.total_seconds + seconds,
+            ))
+            changed = True
+
+        # the index page shows these counters
+        if changed:
+            session.info.setdefault('changed_namespaces', set()).add(cache.HACKATHONS_NAMESPACE)
+
+    @classmethod
+    def active(cls, now=None):
+        """Query for hackathons currently inside their coding window.
+        """
+        if now is None:
+            now = datetime.utcnow()
+        return cls.query.filter(cls.coding_starts_at <= now, cls.coding_ends_at >= now)
+
+    @classmethod
+    def to_finalize(cls, now=None):
+        """Query for hackathons which ended at least FINALIZE_DELAY ago and
+        have not been frozen into snapshots yet.
+        """
+        if now is None:
+            now = datetime.utcnow()
+        return cls.query.filter(
+            cls.coding_ends_at < now - app.config['FINALIZE_DELAY'],
+            cls.finalized_at == None,
+        )
+
+    def is_active(self, now=None):
+        if now is None:
+            now = datetime.utcnow()
+        return self.coding_starts_at <= now <= self.coding_ends_at
+
+    def has_ended(self, now=None):
+        if now is None:
+            now = datetime.utcnow()
+        return self.coding_ends_at < now
+
+    def coding_dates(self):
+        """Return the first and last day of coding in this hackathon's
+        timezone.
+        """
+        timezone = pytz.timezone(self.timezone)
+        start = self.coding_starts_at.replace(tzinfo=pytz.utc).astimezone(timezone).date()
+        end = self.coding_ends_at.replace(tzinfo=pytz.utc).astimezone(timezone).date()
+        return start, end
+
+    def today(self):
+        return datetime.now(pytz.timezone(self.timezone)).date()
+
+    def leaderboard(self, limit=None, after=None):
+        return Rank.leaderboard(self.id, limit=limit, after=after)
+
+    def top(self, n):
+        return Rank.leaderboard(self.id, limit=n)
+
 
 class Rank(Model):
     id = db.Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
@@ -379,12 +896,141 @@ class Rank(Model):
     created_at = db.Column(db.DateTime(), nullable=False, default=datetime.utcnow)
     modified_at = db.Column(db.DateTime(), onupdate=datetime.utcnow)
 
+    __table_args__ = (
+        db.UniqueConstraint('user_id', 'hackathon_id', name='uq_rank_user_id_hackathon_id'),
+    )
+    conflict_fields = ['user_id', 'hackathon_id']
+
     def __repr__(self):
         return u'Rank for {user_id} at {hackathon_id}'.format(
             user_id=self.user_id,
             hackathon_id=self.hackathon_id,
         )
 
+    @classmethod
+    def leaderboard(cls, hackathon_id, limit=None, after=None, user_ids=None):
+        """Return LeaderboardRows for a hackathon ordered by total_seconds,
+        highest first. Pages using a keyset cursor (total_seconds, id) of
+        the last row from the previous page, so each page is a range scan of
+        ix_rank_hackathon_id_total_seconds no matter how deep it is. With
+        user_ids only returns those users' rows.
+        """
+        query = cls._leaderboard_query(hackathon_id, limit=limit, after=after)
+        if user_ids is not None:
+            query = query.filter(cls.user_id.in_(user_ids))
+        return [LeaderboardRow(*row) for row in query]
+
+    @classmethod
+    def iter_leaderboard(cls, hackathon_id, limit=None, after=None):
+        """Like leaderboard, but yields rows lazily from a server-side
+        cursor, fetching LEADERBOARD_STREAM_BATCH rows at a time, so memory
+        use does not grow with the size of the leaderboard.
+        """
+        query = cls._leaderboard_query(hackathon_id, limit=limit, after=after)
+        query = query.execution_options(stream_results=True).yield_per(app.config['LEADERBOARD_STREAM_BATCH'])
+        for row in query:
+            yield LeaderboardRow(*row)
+
+    @classmethod
+    def _leaderboard_query(cls, hackathon_id, limit=None, after=None):
+        query = db.session.query(
+            cls.id,
+            cls.user_id,
+            cls.hackathon_id,
+            cls.total_seconds,
+            User.full_name,
+            User.username,
+            User.profile_url,
+            User.avatar_url,
+        ).join(User, User.id == cls.user_id).filter(cls.hackathon_id == hackathon_id)
+        if after is not None:
+            query = query.filter(tuple_(cls.total_seconds, cls.id) < tuple_(
+                db.bindparam('after_seconds', after[0], type_=cls.total_seconds.type),
+                db.bindparam('after_id', after[1], type_=cls.id.type),
+            ))
+        query = query.order_by(cls.total_seconds.desc(), cls.id.desc())
+        if limit is not None:
+            query = query.limit(limit)
+        return query
+
+    @classmethod
+    def neighbourhood(cls, hackathon_id, user_id, k):
+        """Return RankedRows for a user and the k ranks above and below them
+        in a hackathon, highest first, or an empty list if they have not
+        joined it. One query numbering the hackathon's ranks with window
+        functions in the order of ix_rank_hackathon_id_total_seconds, so no
+        rows are loaded besides the ones returned.
+        """
+        order_by = (cls.total_seconds.desc(), cls.id.desc())
+        ranked = db.session.query(
+            cls.id,
+            cls.user_id,
+            cls.hackathon_id,
+            cls.total_seconds,
+            db.func.rank().over(partition_by=cls.hackathon_id, order_by=cls.total_seconds.desc()).label('position'),
+            db.func.row_number().over(partition_by=cls.hackathon_id, order_by=order_by).label('row_number'),
+            db.func.count(cls.id).over(partition_by=cls.hackathon_id).label('participants_count'),
+        ).filter(cls.hackathon_id == hackathon_id).cte('ranked')
+        me = db.session.query(ranked.c.row_number).filter(ranked.c.user_id == user_id).cte('me')
+        query = db.session.query(
+            ranked.c.id,
+            ranked.c.user_id,
+            ranked.c.hackathon_id,
+            ranked.c.total_seconds,
+            User.full_name,
+            User.username,
+            User.profile_url,
+            User.avatar_url,
+            ranked.c.position,
+            ranked.c.participants_count,
+        ).join(User, User.id == ranked.c.user_id).filter(
+            ranked.c.row_number.between(me.c.row_number - k, me.c.row_number + k),
+        ).order_by(ranked.c.row_number)
+        return [RankedRow(*row) for row in query]
+
+    @classmethod
+    def standings(cls, user_id):
+        """Return a Standing for each hackathon a user has joined, most
+        recent first, ranking only the ranks of those hackathons in one
+        query.
+        """
+        joined = db.session.query(cls.hackathon_id).filter(cls.user_id == user_id)
+        ranked = db.session.query(
+            cls.user_id,
+            cls.hackathon_id,
+            cls.total_seconds,
+            db.func.rank().over(partition_by=cls.hackathon_id, order_by=cls.total_seconds.desc()).label('position'),
+        ).filter(cls.hackathon_id.in_(joined.subquery())).subquery('ranked')
+        query = db.session.query(
+            Hackathon.id,
+            Hackathon.name,
+            Hackathon.coding_starts_at,
+            Hackathon.coding_ends_at,
+            ranked.c.total_seconds,
+            ranked.c.position,
+            Hackathon.participants_count,
+        ).join(ranked, ranked.c.hackathon_id == Hackathon.id).filter(
+            ranked.c.user_id == user_id,
+        ).order_by(Hackathon.coding_starts_at.desc(), Hackathon.id.desc())
+        return [Standing(*row) for row in query]
+
+    @staticmethod
+    def parse_cursor(cursor):
+        """Parse a `<total_seconds>,<id>` cursor string, returning None
+        when it is missing or malformed.
+        """
+        if not cursor:
+            return None
+        try:
+            seconds, rank_id = cursor.split(',', 1)
+            return int(seconds), uuid.UUID(rank_id)
+        except ValueError:
+            return None
+
+    @property
+    def cursor(self):
+        return u'{0},{1}'.format(self.total_seconds, self.id)
+
     @property
     def full_name(self):
         return self.user.full_name
@@ -403,16 +1049,202 @@ class Rank(Model):
 
     @property
     def coding_time(self):
-        hours = int(math.floor(self.total_seconds / 3600.0))
-        minutes = int(math.floor(self.total_seconds / 60.0)) % 60
-        seconds = self.total_seconds % 60
-        coding_time = ''
-        if hours > 0:
-            plural = 's' if hours != 1 else ''
-            coding_time = '{0} hour{1} '.format(hours, plural)
-        if minutes > 0:
-            plural = 's' if minutes != 1 else ''
-            coding_time = '{0}{1} minute{2} '.format(coding_time, minutes, plural)
-        plural = 's' if seconds != 1 else ''
-        coding_time = '{0}{1} second{2} '.format(coding_time, seconds, plural)
-        return coding_time
+        return format_coding_time(self.total_seconds)
+
+
+class DailyTotal(Model):
+    """Coding time for one user on one day, as returned by the summaries
+    api. A day is finalized once it is older than FINALIZE_DAYS, after
+    which it is never fetched again.
+    """
+    FINALIZE_DAYS = 1
+
+    user_id = db.Column(UUID(as_uuid=True), db.ForeignKey('user.id'), primary_key=True)
+    date = db.Column(db.Date(), primary_key=True)
+    total_seconds = db.Column(db.Integer(), nullable=False)
+    finalized = db.Column(db.Boolean(), nullable=False, default=False)
+    created_at = db.Column(db.DateTime(), nullable=False, default=datetime.utcnow)
+    modified_at = db.Column(db.DateTime(), onupdate=datetime.utcnow)
+
+    conflict_fields = ['user_id', 'date']
+
+    def __repr__(self):
+        return u'DailyTotal for {user_id} on {date}'.format(
+            user_id=self.user_id,
+            date=self.date,
+        )
+
+    @classmethod
+    def finalized_dates(cls, user_ids, start, end):
+        """Return a set of finalized dates between start and end for each
+        user id.
+        """
+        dates = dict((user_id, set()) for user_id in user_ids)
+        if not user_ids:
+            return dates
+        query = db.session.query(cls.user_id, cls.date).filter(
+            cls.user_id.in_(user_ids),
+            cls.date.between(start, end),
+            cls.finalized == True,
+        )
+        for user_id, date in query:
+            dates[user_id].add(date)
+        return dates
+
+    @classmethod
+    def store_many(cls, totals, today):
+        """Save {user_id: {date: total_seconds}} with one upsert statement.
+        """
+        finalized_before = today - timedelta(days=cls.FINALIZE_DAYS)
+        rows = []
+        for user_id, days in totals.items():
+            for date, total_seconds in days.items():
+                rows.append({
+                    'user_id': user_id,
+                    'date': date,
+                    'total_seconds': total_seconds,
+                    'finalized': date < finalized_before,
+                })
+        cls.upsert_many(rows)
+
+    @classmethod
+    def sums(cls, user_ids, start, end):
+        """Return {user_id: total_seconds} between start and end, summed in
+        the database.
+        """
+        if not user_ids:
+            return {}
+        query = db.session.query(cls.user_id, db.func.sum(cls.total_seconds)).filter(
+            cls.user_id.in_(user_ids),
+            cls.date.between(start, end),
+        ).group_by(cls.user_id)
+        return dict((user_id, int(total)) for user_id, total in query)
+
+
+db.Index('ix_hackathon_coding_starts_at_id', Hackathon.coding_starts_at, Hackathon.id)
+db.Index('ix_rank_hackathon_id_total_seconds', Rank.hackathon_id, Rank.total_seconds.desc(), Rank.id.desc())
+
+
+""" Cache Invalidation
+"""
+
+
+def changed_namespaces(instance):
+    if isinstance(instance, Rank):
+        return [cache.hackathon_namespace(instance.hackathon_id)]
+    if isinstance(instance, Hackathon):
+        return [cache.hackathon_namespace(instance.id), cache.HACKATHONS_NAMESPACE]
+    if isinstance(instance, User):
+        return [cache.user_namespace(instance.id)]
+    return []
+
+
+def invalidate_on_commit(namespace):
+    """Bump a cache namespace when the current transaction commits, for
+    changes made with bulk statements that bypass the session.
+    """
+    db.session.info.setdefault('changed_namespaces', set()).add(namespace)
+
+
+def counters_changed_on_commit(hackathon_id, participants=0, seconds=0, session=None):
+    """Add to a hackathon's participants_count and total_seconds when the
+    current transaction commits. Rank changes made in the session are
+    counted automatically, bulk statements must call this themselves.
+    """
+    if session is None:
+        session = db.session
+    deltas = session.info.setdefault('counter_deltas', {})
+    old_participants, old_seconds = deltas.get(hackathon_id, (0, 0))
+    deltas[hackathon_id] = (old_participants + participants, old_seconds + seconds)
+
+
+def committed_value(instance, key):
+    """Return the value an attribute had before its pending change.
+    """
+    history = get_history(instance, key)
+    if history.deleted:
+        return history.deleted[0]
+    if history.unchanged:
+        return history.unchanged[0]
+    return None
+
+
+def bulk_changed(instance):
+    """Record a change to instance made by a bulk statement.
+    """
+    for namespace in changed_namespaces(instance):
+        invalidate_on_commit(namespace)
+
+
+@event.listens_for(SignallingSession, 'after_flush')
+def collect_changes(session, flush_context):
+    namespaces = session.info.setdefault('changed_namespaces', set())
+    for instance in list(session.new) + list(session.dirty) + list(session.deleted):
+        namespaces.update(changed_namespaces(instance))
+        if isinstance(instance, Rank):
+            if instance in session.new:
+                counters_changed_on_commit(instance.hackathon_id, 1, instance.total_seconds or 0, session=session)
+            elif instance in session.deleted:
+                counters_changed_on_commit(instance.hackathon_id, -1, -(committed_value(instance, 'total_seconds') or 0), session=session)
+            else:
+                seconds = (instance.total_seconds or 0) - (committed_value(instance, 'total_seconds') or 0)
+                counters_changed_on_commit(instance.hackathon_id, seconds=seconds, session=session)
+        if isinstance(instance, Hackathon):
+            session.info['hackathons_changed'] = True
+
+
+@event.listens_for(SignallingSession, 'before_commit')
+def apply_counter_deltas(session):
+
+    # savepoints from begin_nested commit too, wait for the real commit
+    if session.transaction.nested:
+        return
+
+    # flush first, so pending rank changes are counted
+    session.flush()
+    Hackathon.add_to_counters(session.info.pop('counter_deltas', {}), session=session)
+
+
+@event.listens_for(SignallingSession, 'after_commit')
+def bump_changed_namespaces(session):
+
+    # a released savepoint is not committed yet, and may still be rolled
+    # back with its outer transaction
+    if session.transaction.nested:
+        session.info.get('savepoints', {}).pop(session.transaction, None)
+        return
+    session.info.pop('savepoints', None)
+    for namespace in session.info.pop('changed_namespaces', []):
+        cache.bump_version(namespace)
+    if session.info.pop('hackathons_changed', False):
+        hackathon_refs.clear()
+
+
+@event.listens_for(SignallingSession, 'after_transaction_create')
+def save_changes(session, transaction):
+    """Copy the changes collected before a savepoint, so rolling it back
+    only discards changes made inside it.
+    """
+    if transaction.nested:
+        session.info.setdefault('savepoints', {})[transaction] = (
+            set(session.info.get('changed_namespaces', ())),
+            dict(session.info.get('counter_deltas', {})),
+            session.info.get('hackathons_changed', False),
+        )
+
+
+@event.listens_for(SignallingSession, 'after_rollback')
+def discard_changes(session):
+    saved = None
+    if session.transaction.nested:
+        saved = session.info.get('savepoints', {}).pop(session.transaction, None)
+    if saved is not None:
+        namespaces, deltas, hackathons_changed = saved
+        session.info['changed_namespaces'] = namespaces
+        session.info['counter_deltas'] = deltas
+        session.info['hackathons_changed'] = hackathons_changed
+        return
+    session.info.pop('changed_namespaces', None)
+    session.info.pop('counter_deltas', None)
+    session.info.pop('hackathons_changed', None)
+    session.info.pop('savepoints', None)
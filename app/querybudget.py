@@ -0,0 +1,89 @@
+# -*- coding: utf-8 -*-
+"""
+    hackathonranks.querybudget
+    ~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+    Counting SQL statements per view, to catch query regressions.
+
+    Views declare how many statements one request may run with the
+    query_budget decorator. benchmarks/query_budget.py requests every view
+    against a seeded database while recording statements, and fails when a
+    view goes over its budget or runs the same statement again and again
+    with different parameters, the usual sign of an N+1 lazy load.
+"""
+
+
+from collections import defaultdict
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+
+# statements run this many times with different parameters are flagged
+REPEAT_THRESHOLD = 3
+
+
+def query_budget(max_queries):
+    """Declare the most SQL statements one request to this view may run.
+    Use it below the route decorator.
+    """
+    def decorator(func):
+        func.query_budget = max_queries
+        return func
+    return decorator
+
+
+class QueryRecorder(object):
+    """Records every SQL statement run on any engine while active.
+
+    Usage::
+
+        >>> with QueryRecorder() as recorder:
+        >>>     client.get('/')
+        >>> print(recorder.problems(budget=3))
+    """
+
+    def __init__(self):
+        self.statements = []
+
+        # event.remove needs the same callable that was passed to listen
+        self._listener = self._record
+
+    def __enter__(self):
+        event.listen(Engine, 'before_cursor_execute', self._listener)
+        return self
+
+    def __exit__(self, *args):
+        event.remove(Engine, 'before_cursor_execute', self._listener)
+
+    def _record(self, conn, cursor, statement, parameters, context, executemany):
+        self.statements.append((statement, parameters))
+
+    def repeated(self, threshold=REPEAT_THRESHOLD):
+        """Return (statement, count) for statements run at least threshold
+        times with more than one set of parameters.
+        """
+        parameters = defaultdict(list)
+        for statement, params in self.statements:
+            parameters[statement].append(repr(params))
+        return [
+            (statement, len(params))
+            for statement, params in parameters.items()
+            if len(params) >= threshold and len(set(params)) > 1
+        ]
+
+    def problems(self, budget):
+        """Return a description of each problem with the recorded
+        statements for a view with this budget.
+        """
+        problems = []
+        if budget is None:
+            problems.append(u'no query budget declared')
+        elif len(self.statements) > budget:
+            problems.append(u'ran {0} statements, budget is {1}'.format(len(self.statements), budget))
+        for statement, count in self.repeated():
+            problems.append(u'likely N+1, ran {0} times with different parameters: {1}'.format(
+                count,
+                u' '.join(statement.split())[:200],
+            ))
+        return problems
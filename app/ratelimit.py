@@ -0,0 +1,79 @@
+# -*- coding: utf-8 -*-
+"""
+    hackathonranks.ratelimit
+    ~~~~~~~~~~~~~~~~~~~~~~~~
+
+    Rate limiting shared by every process through memcached.
+"""
+
+
+import math
+import random
+import time
+
+from app import cache
+
+
+# times to retry taking a token when other workers keep changing the
+# bucket first
+CAS_ATTEMPTS = 10
+
+
+class TokenBucketRateLimiter(object):
+    """Allows `rate` calls per `per` seconds, in bursts of at most `burst`
+    calls, for every worker on every node together.
+
+    The bucket is one memcached key holding the time it will be full again,
+    as in the generic cell rate algorithm. Taking a token reads it with
+    gets and moves it one interval of per / rate seconds later with cas, so
+    a concurrent change makes cas fail and the worker reads it again. No
+    interval of `per` seconds ever has more than rate + burst - 1 calls.
+    Times come from each node's clock, so keep them in sync with ntp.
+    """
+
+    def __init__(self, name, rate, per=1, burst=1):
+        self.name = name
+        self.rate = rate
+        self.per = per
+        self.burst = burst
+        self.interval = float(per) / rate
+        self.tolerance = self.interval * (burst - 1)
+
+        # an expired bucket is a full one
+        self.expires = int(math.ceil(self.tolerance + self.interval)) + 1
+
+    def try_acquire(self):
+        """Take a token if one is left. Returns the number of seconds to
+        wait before trying again, or 0 when a token was taken.
+        """
+        key = cache.make_key('ratelimit', self.name)
+        for attempt in range(CAS_ATTEMPTS):
+            now = time.time()
+            full_at = cache.client.gets(key)
+            if full_at is None:
+                if cache.client.add(key, now + self.interval, time=self.expires):
+                    return 0
+                continue
+            full_at = max(full_at, now)
+            wait = full_at - self.tolerance - now
+            if wait > 0:
+                return wait
+            if cache.client.cas(key, full_at + self.interval, time=self.expires):
+                return 0
+        return self.interval
+
+    def acquire(self, timeout=None):
+        """Block until a token is available. Returns False if that would
+        take longer than timeout seconds.
+        """
+        deadline = time.time() + timeout if timeout is not None else None
+        while True:
+            wait = self.try_acquire()
+            if not wait:
+                return True
+
+            # spread waiting workers over the next interval
+            wait += random.uniform(0, self.interval / 10.0)
+            if deadline is not None and time.time() + wait > deadline:
+                return False
+            time.sleep(wait)
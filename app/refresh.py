@@ -0,0 +1,221 @@
+# -*- coding: utf-8 -*-
+"""
+    hackathonranks.refresh
+    ~~~~~~~~~~~~~~~~~~~~~~
+
+    Refreshing participants' coding time from WakaTime.
+
+    RefreshEngine fans summaries requests for a batch of participants out
+    over a thread pool, while the shared rate limiter in app.wakatime keeps
+    all processes within the api limits. Only the http calls run in pool
+    threads; DailyTotals and Ranks are written from the calling thread, with
+    one UPDATE statement per batch for Ranks.
+"""
+
+
+import time
+from datetime import datetime, timedelta
+from multiprocessing.pool import ThreadPool
+
+from sqlalchemy import and_, select
+
+from app import app, cache, wakatime
+from app.models import db, invalidate_on_commit, DailyTotal, Hackathon, User, Rank
+
+
+class SummariesError(Exception):
+    """WakaTime refused the summaries request, for ex: a revoked token.
+    """
+
+
+def fetch_daily_totals(access_token, start, end):
+    """Return {date: total_seconds} for each day from start to end. Only
+    uses plain values, so it is safe to call from worker threads.
+    """
+    response = wakatime.summaries(access_token, start.strftime('%m/%d/%Y'), end.strftime('%m/%d/%Y'))
+
+    app.logger.debug(response.status_code)
+    app.logger.debug(response.text)
+
+    if response.status_code != 200:
+        raise SummariesError(u'Summaries returned {0}'.format(response.status_code))
+
+    # keyed by each day's own date, since days may be missing or out of
+    # order in the response
+    totals = {}
+    for day in response.json()['data']:
+        date = datetime.strptime(day['range']['date'], '%Y-%m-%d').date()
+        totals[date] = int(day['grand_total']['total_seconds'])
+    return totals
+
+
+def fetch(job):
+    """Fetch one (user_id, access_token, start, end) job, returning the
+    user_id with either the daily totals or the exception raised.
+    """
+    user_id, access_token, start, end = job
+    try:
+        return user_id, fetch_daily_totals(access_token, start, end)
+    except (wakatime.WakaTimeError, SummariesError) as e:
+        return user_id, e
+
+
+def update_ranks(hackathon, user_ids):
+    """Set total_seconds of existing Ranks from their users' DailyTotals,
+    summed in the database with a single UPDATE statement.
+    """
+    if not user_ids:
+        return
+    start, end = hackathon.coding_dates()
+    total_seconds = select([db.func.coalesce(db.func.sum(DailyTotal.total_seconds), 0)]).where(and_(
+        DailyTotal.user_id == Rank.user_id,
+        DailyTotal.date.between(start, end),
+    )).as_scalar()
+    db.session.execute(Rank.__table__.update().where(and_(
+        Rank.hackathon_id == hackathon.id,
+        Rank.user_id.in_(user_ids),
+    )).values(
+        total_seconds=total_seconds,
+        modified_at=datetime.utcnow(),
+    ))
+
+    # bulk updates skip the session's change tracking, the hackathon's
+    # counters are recounted once the whole refresh is done
+    invalidate_on_commit(cache.hackathon_namespace(hackathon.id))
+
+
+class RefreshEngine(object):
+    """Refreshes participants' Ranks using `concurrency` threads for the
+    summaries requests, `batch_size` participants at a time.
+
+    Usage::
+
+        >>> with RefreshEngine() as engine:
+        >>>     metrics = engine.refresh(hackathon)
+    """
+
+    def __init__(self, concurrency=None, batch_size=None):
+        self.concurrency = concurrency or app.config['REFRESH_CONCURRENCY']
+        self.batch_size = batch_size or app.config['REFRESH_BATCH_SIZE']
+        self._pool = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def close(self):
+        if self._pool is not None:
+            self._pool.close()
+            self._pool.join()
+            self._pool = None
+
+    def fetch_many(self, jobs):
+        """Fetch (user_id, access_token, start, end) jobs concurrently.
+        Returns a list of (user_id, totals or exception).
+        """
+        if self.concurrency <= 1:
+            return [fetch(job) for job in jobs]
+        if self._pool is None:
+            self._pool = ThreadPool(self.concurrency)
+        return self._pool.map(fetch, jobs, chunksize=1)
+
+    def sync(self, hackathon, participants):
+        """Fetch and store DailyTotals for a list of (user_id, access_token),
+        only requesting days after each user's last finalized day up to
+        today. Returns {user_id: exception} for participants whose fetch
+        failed.
+        """
+        start, end = hackathon.coding_dates()
+        today = hackathon.today()
+        last = min(end, today)
+        finalized = DailyTotal.finalized_dates([p[0] for p in participants], start, last)
+
+        jobs = []
+        for user_id, access_token in participants:
+            first = start
+            while first <= last and first in finalized[user_id]:
+                first += timedelta(days=1)
+            if first <= last:
+                jobs.append((user_id, access_token, first, last))
+
+        totals = {}
+        failures = {}
+        for user_id, result in self.fetch_many(jobs):
+            if isinstance(result, Exception):
+                failures[user_id] = result
+            else:
+                totals[user_id] = result
+        DailyTotal.store_many(totals, today)
+        return failures
+
+    def refresh(self, hackathon):
+        """Refresh every participant's Rank for a hackathon, committing after
+        each batch. Returns throughput and lag metrics for the run.
+        """
+        started = time.time()
+        now = datetime.utcnow()
+        participants = db.session.query(
+            Rank.user_id,
+            User.wakatime_token,
+            db.func.coalesce(Rank.modified_at, Rank.created_at),
+        ).join(User, User.id == Rank.user_id).filter(Rank.hackathon_id == hackathon.id).all()
+
+        refreshed = 0
+        failed = 0
+        for offset in range(0, len(participants), self.batch_size):
+            batch = participants[offset:offset + self.batch_size]
+            failures = self.sync(hackathon, [(p[0], p[1]) for p in batch])
+            for user_id, e in failures.items():
+                app.logger.warning(u'Refresh failed for {0}: {1}'.format(user_id, e))
+            user_ids = [p[0] for p in batch if p[0] not in failures]
+            update_ranks(hackathon, user_ids)
+            db.session.commit()
+            refreshed += len(user_ids)
+            failed += len(failures)
+
+        # joins add to the counters in place, recount them here so any
+        # drift, for ex: from concurrent joins by one user, never lasts
+        Hackathon.update_counters([hackathon.id])
+        db.session.commit()
+
+        elapsed = time.time() - started
+        lags = [(now - updated_at).total_seconds() for _, _, updated_at in participants]
+        metrics = {
+            'hackathon_id': unicode(hackathon.id),
+            'participants': len(participants),
+            'refreshed': refreshed,
+            'failed': failed,
+            'concurrency': self.concurrency,
+            'elapsed_seconds': round(elapsed, 3),
+            'ranks_per_second': round(refreshed / elapsed, 3) if elapsed else None,
+            'max_lag_seconds': round(max(lags), 3) if lags else None,
+            'mean_lag_seconds': round(sum(lags) / len(lags), 3) if lags else None,
+        }
+        app.logger.info(u'Refreshed hackathon: {0}'.format(metrics))
+        return metrics
+
+
+def update_rank(user, hackathon):
+    """Fetch one user's coding time for a hackathon and save their Rank.
+    """
+    failures = RefreshEngine(concurrency=1).sync(hackathon, [(user.id, user.wakatime_token)])
+    if failures:
+        raise failures[user.id]
+
+    start, end = hackathon.coding_dates()
+    total_seconds = DailyTotal.sums([user.id], start, end).get(user.id, 0)
+
+    # the row lock makes concurrent joins wait for each other, so each one
+    # counts its change from the other's committed total_seconds
+    rank, created = Rank._get_or_create(
+        user_id=user.id,
+        hackathon_id=hackathon.id,
+        defaults={'total_seconds': total_seconds},
+        for_update=True,
+    )
+    if not created:
+        rank.set_columns(total_seconds=total_seconds)
+    db.session.commit()
+    return rank
@@ -0,0 +1,160 @@
+# -*- coding: utf-8 -*-
+"""
+    hackathonranks.snapshots
+    ~~~~~~~~~~~~~~~~~~~~~~~~
+
+    Frozen leaderboards of ended hackathons.
+
+    Once a hackathon has ended its ranks never change, so finalize does one
+    last refresh then writes the final standings as a compact json file and
+    a pre-rendered html page in SNAPSHOT_DIR. Views serve those files
+    instead of querying ranks and rendering templates, the html page only
+    to anonymous visitors since it has their header. With
+    SNAPSHOT_X_ACCEL nginx sends them, from an internal location like::
+
+        location /snapshots/ {
+            internal;
+            alias /path/to/hackathonranks/snapshots/;
+        }
+
+    SNAPSHOT_DIR must be shared by every node, see config.
+
+    Hackathons are finalized by a scheduled task, or from the command line
+    with::
+
+        python -m app.snapshots "Some Hackathon"
+"""
+
+
+import os
+import sys
+from datetime import datetime
+
+from flask import send_file
+
+from app import app, utils
+from app import json as app_json
+from app.models import db, Hackathon, Rank
+from app.refresh import RefreshEngine
+
+
+HTML_FILENAME = 'index.html'
+JSON_FILENAME = 'leaderboard.json'
+
+# columns of each row in the json snapshot
+JSON_FIELDS = ['rank', 'user_id', 'full_name', 'username', 'profile_url', 'avatar_url', 'total_seconds']
+
+
+def snapshot_path(hackathon_id, filename):
+    return os.path.join(app.config['SNAPSHOT_DIR'], unicode(hackathon_id), filename)
+
+
+def write_atomically(path, chunks):
+    """Write chunks of bytes to a temporary file renamed over path, so
+    nginx never sends a partly written snapshot.
+    """
+    directory = os.path.dirname(path)
+    if not os.path.exists(directory):
+        os.makedirs(directory)
+    tmp = '{0}.{1}.tmp'.format(path, os.getpid())
+    with open(tmp, 'wb') as fh:
+        for chunk in chunks:
+            fh.write(chunk)
+    os.rename(tmp, path)
+
+
+def write_snapshot(hackathon):
+    """Write a hackathon's whole leaderboard as json and html files.
+    """
+    hackers = Rank.leaderboard(hackathon.id)
+
+    data = {
+        'hackathon': {
+            'id': hackathon.id,
+            'name': hackathon.name,
+            'coding_starts_at': hackathon.coding_starts_at,
+            'coding_ends_at': hackathon.coding_ends_at,
+            'timezone': hackathon.timezone,
+        },
+        'total': len(hackers),
+        'fields': JSON_FIELDS,
+        'data': [[
+            i + 1,
+            hacker.user_id,
+            hacker.full_name,
+            hacker.username,
+            hacker.profile_url,
+            hacker.avatar_url,
+            hacker.total_seconds,
+        ] for i, hacker in enumerate(hackers)],
+    }
+    chunks = (chunk.encode('utf-8') for chunk in app_json.iterencode(data))
+    write_atomically(snapshot_path(hackathon.id, JSON_FILENAME), chunks)
+
+    # rendered for anonymous visitors, like cached pages
+    with app.test_request_context(u'/hackathon/' + hackathon.name):
+        context = {
+            'hackathon': hackathon,
+            'hackers': hackers,
+            'start': 0,
+            'next_url': None,
+            'finalized': True,
+        }
+        chunks = (chunk.encode('utf-8') for chunk in utils.stream_template('hackathon.html', **context))
+        write_atomically(snapshot_path(hackathon.id, HTML_FILENAME), chunks)
+
+
+def finalize(hackathon, refresh=True):
+    """Refresh every participant one last time, write the snapshot and mark
+    the hackathon finalized, so views serve the snapshot and joins are
+    rejected.
+    """
+
+    # the page is rendered in a request context, which would push and tear
+    # down its own app context, removing the session, if there was none
+    with app.app_context():
+        if refresh:
+            with RefreshEngine() as engine:
+                engine.refresh(hackathon)
+        write_snapshot(hackathon)
+        hackathon_id = hackathon.id
+        hackathon.finalized_at = datetime.utcnow()
+        db.session.commit()
+    app.logger.info(u'Finalized hackathon: {0}'.format(hackathon_id))
+
+
+def serve(hackathon_id, filename, mimetype):
+    """Return a response sending a snapshot file, or None when this node
+    has no such file, so the caller can render the page instead.
+    """
+    path = snapshot_path(hackathon_id, filename)
+    if not os.path.exists(path):
+        return None
+    if app.config['SNAPSHOT_X_ACCEL']:
+        response = app.response_class(mimetype=mimetype)
+        response.headers['X-Accel-Redirect'] = u'{0}/{1}/{2}'.format(app.config['SNAPSHOT_URL'], hackathon_id, filename)
+        return response
+    return send_file(path, mimetype=mimetype, conditional=True)
+
+
+def main():
+    """Finalize the hackathons named on the command line, or every one
+    ended more than FINALIZE_DELAY ago.
+    """
+    if len(sys.argv) > 1:
+        hackathons = Hackathon.query.filter(Hackathon.name.in_([name.decode('utf-8') for name in sys.argv[1:]])).all()
+    else:
+        hackathons = Hackathon.to_finalize().all()
+    now = datetime.utcnow()
+    for hackathon in hackathons:
+        name = hackathon.name
+        if hackathon.coding_ends_at >= now:
+            print(u'Skipping {0}, it has not ended yet.'.format(name))
+            continue
+        finalize(hackathon)
+        print(u'Finalized {0}.'.format(name))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,157 @@
+# -*- coding: utf-8 -*-
+"""
+    hackathonranks.standings
+    ~~~~~~~~~~~~~~~~~~~~~~~~
+
+    In-process sorted leaderboards, for finding a participant's place and
+    neighbours without ranking every Rank of a hackathon in the database.
+
+    Boards are read-only and tagged with the hackathon's cache version,
+    which every rank write bumps, so a board is never used after its ranks
+    change: the next lookup builds a new one. The first process to build a
+    board for a version saves it to memcached in chunks, so other processes
+    load it from there instead of querying every rank. The database stays
+    the source of truth.
+"""
+
+
+import uuid
+from bisect import bisect_left, bisect_right
+
+from app import app, cache
+from app.models import db, Rank, RankedRow
+
+
+class SortedLeaderboard(object):
+    """Ranks of one hackathon as a sorted list of (total_seconds, rank id,
+    user id), in the reverse order of Rank.leaderboard. Position lookups
+    bisect the list in O(log n) and neighbour slices copy only the 2k+1
+    entries returned.
+    """
+
+    def __init__(self, entries):
+        self._entries = sorted(entries)
+        self._seconds = [entry[0] for entry in self._entries]
+        self._by_user = dict((entry[2], entry) for entry in self._entries)
+
+    def __len__(self):
+        return len(self._entries)
+
+    def entries(self):
+        return self._entries
+
+    def position(self, user_id):
+        """Return a participant's place, 1 for the most coding time, or None
+        if they have no rank. Tied participants share a place, like SQL's
+        rank().
+        """
+        entry = self._by_user.get(unicode(user_id))
+        if entry is None:
+            return None
+        return len(self._seconds) - bisect_right(self._seconds, entry[0]) + 1
+
+    def neighbours(self, user_id, k):
+        """Return (user_id, position) of a participant and the k ranks above
+        and below them, highest first, or an empty list if they have no
+        rank.
+        """
+        entry = self._by_user.get(unicode(user_id))
+        if entry is None:
+            return []
+        index = bisect_left(self._entries, entry)
+        around = self._entries[max(0, index - k):index + k + 1]
+        count = len(self._seconds)
+        return [
+            (neighbour[2], count - bisect_right(self._seconds, neighbour[0]) + 1)
+            for neighbour in reversed(around)
+        ]
+
+
+boards = cache.LRUCache(
+    maxsize=app.config['STANDINGS_CACHE_SIZE'],
+    ttl=app.config['STANDINGS_TIMEOUT'],
+)
+
+
+def snapshot_key(hackathon_id, version, *parts):
+    return cache.make_key('standings', hackathon_id, version, *parts)
+
+
+def save_snapshot(hackathon_id, version, board):
+    """Store a board in memcached in chunks of STANDINGS_CHUNK_SIZE ranks.
+    """
+    size = app.config['STANDINGS_CHUNK_SIZE']
+    timeout = app.config['STANDINGS_TIMEOUT']
+    entries = board.entries()
+    chunks = {}
+    for offset in range(0, len(entries), size):
+        chunks[snapshot_key(hackathon_id, version, offset // size)] = entries[offset:offset + size]
+    if chunks:
+        cache.client.set_multi(chunks, time=timeout)
+
+    # the chunk count is written last, so readers never see a partial board
+    cache.client.set(snapshot_key(hackathon_id, version), len(chunks), time=timeout)
+
+
+def load_snapshot(hackathon_id, version):
+    """Return the board stored by save_snapshot for this version, or None.
+    """
+    count = cache.client.get(snapshot_key(hackathon_id, version))
+    if count is None:
+        return None
+    keys = [snapshot_key(hackathon_id, version, i) for i in range(count)]
+    found = cache.client.get_multi(keys) if keys else {}
+    if len(found) < count:
+        return None
+    entries = []
+    for key in keys:
+        entries.extend(found[key])
+    return SortedLeaderboard(entries)
+
+
+def load_from_database(hackathon_id):
+    query = db.session.query(Rank.total_seconds, Rank.id, Rank.user_id).filter(Rank.hackathon_id == hackathon_id)
+    return SortedLeaderboard((total_seconds, unicode(rank_id), unicode(user_id)) for total_seconds, rank_id, user_id in query)
+
+
+def get_board(hackathon_id):
+    """Return the board for a hackathon's current ranks, or None when its
+    cache version can not be read, so a board can not be validated.
+    """
+    version = cache.get_version(cache.hackathon_namespace(hackathon_id))
+    if version is None:
+        return None
+
+    key = unicode(hackathon_id)
+    cached = boards.get(key)
+    if cached is not None and cached[0] == version:
+        return cached[1]
+
+    board = load_snapshot(key, version)
+    if board is None:
+        board = load_from_database(hackathon_id)
+        save_snapshot(key, version, board)
+    boards.set(key, (version, board))
+    return board
+
+
+def neighbourhood(hackathon_id, user_id, k):
+    """Return RankedRows for a user and the k ranks above and below them,
+    like Rank.neighbourhood, with places from the hackathon's board and
+    display columns from one query by user id. Returns None when there is
+    no board, so callers rank in the database instead.
+    """
+    board = get_board(hackathon_id)
+    if board is None:
+        return None
+    neighbours = board.neighbours(user_id, k)
+    if not neighbours:
+        return []
+
+    rows = Rank.leaderboard(hackathon_id, user_ids=[uuid.UUID(neighbour) for neighbour, _ in neighbours])
+    rows = dict((unicode(row.user_id), row) for row in rows)
+    return [
+        RankedRow(*(rows[neighbour] + (position, len(board))))
+        for neighbour, position in neighbours
+        if neighbour in rows
+    ]
@@ -0,0 +1,111 @@
+# -*- coding: utf-8 -*-
+"""
+    hackathonranks.tasks
+    ~~~~~~~~~~~~~~~~~~~~
+
+    Background jobs using Celery.
+
+    Run a worker, with the scheduler for periodic tasks, using::
+
+        celery -A app.tasks worker --beat
+
+    Set CELERY_ALWAYS_EAGER in config to run tasks inline, for tests and
+    local runs without a broker.
+"""
+
+
+from celery import Celery
+
+from app import app, cache, snapshots, wakatime
+from app.models import db, User, Hackathon
+from app.refresh import RefreshEngine, update_rank
+
+
+celery = Celery('hackathonranks')
+celery.config_from_object('app.config')
+
+
+class AppContextTask(celery.Task):
+    """Runs each task inside a Flask app context, and releases the task's
+    database session when it finishes. Eager tasks share the calling
+    request's session, so leave that one for the request to release.
+    """
+    abstract = True
+
+    def __call__(self, *args, **kwargs):
+        with app.app_context():
+            try:
+                return super(AppContextTask, self).__call__(*args, **kwargs)
+            finally:
+                if not self.request.is_eager:
+                    db.session.remove()
+
+
+@celery.task(base=AppContextTask, bind=True, max_retries=3, default_retry_delay=10)
+def join_hackathon(self, user_id, hackathon_id):
+    """Fetch a user's coding time for a hackathon and save their Rank.
+    """
+    user = User.query.filter_by(id=user_id).first()
+    hackathon = Hackathon.query.filter_by(id=hackathon_id).first()
+    if user is None or hackathon is None or hackathon.finalized_at is not None:
+        return None
+
+    try:
+        rank = update_rank(user, hackathon)
+    except wakatime.WakaTimeError as e:
+        raise self.retry(exc=e)
+
+    return {
+        'total_seconds': rank.total_seconds,
+    }
+
+
+@celery.task(base=AppContextTask, ignore_result=True)
+def refresh_active_hackathons():
+    """Scheduled by celery beat, see CELERYBEAT_SCHEDULE in config.
+    """
+    for hackathon in Hackathon.active().all():
+        refresh_hackathon.delay(unicode(hackathon.id))
+
+
+@celery.task(base=AppContextTask)
+def refresh_hackathon(hackathon_id):
+    hackathon = Hackathon.query.filter_by(id=hackathon_id).first()
+    if hackathon is None or not hackathon.is_active():
+        return None
+
+    # skip this run if the previous one is still going
+    lock = cache.make_key('lock', 'refresh', hackathon_id)
+    if not cache.client.add(lock, 1, time=app.config['REFRESH_LOCK_TIMEOUT']):
+        app.logger.info(u'Refresh of {0} is already running.'.format(hackathon_id))
+        return None
+    try:
+        with RefreshEngine() as engine:
+            return engine.refresh(hackathon)
+    finally:
+        cache.client.delete(lock)
+
+
+@celery.task(base=AppContextTask, ignore_result=True)
+def finalize_ended_hackathons():
+    """Scheduled by celery beat, see CELERYBEAT_SCHEDULE in config.
+    """
+    for hackathon in Hackathon.to_finalize().all():
+        finalize_hackathon.delay(unicode(hackathon.id))
+
+
+@celery.task(base=AppContextTask)
+def finalize_hackathon(hackathon_id):
+    hackathon = Hackathon.query.filter_by(id=hackathon_id).first()
+    if hackathon is None or hackathon.finalized_at is not None:
+        return None
+
+    # shares the refresh lock, so the last refresh never overlaps another
+    lock = cache.make_key('lock', 'refresh', hackathon_id)
+    if not cache.client.add(lock, 1, time=app.config['REFRESH_LOCK_TIMEOUT']):
+        app.logger.info(u'Refresh of {0} is already running.'.format(hackathon_id))
+        return None
+    try:
+        snapshots.finalize(hackathon)
+    finally:
+        cache.client.delete(lock)
@@ -16,6 +16,17 @@ from app import app
 from app.compat import u
 
 
+# try importing uwsgi, which will fail if we are not in app context
+# for example when running command line scripts or alembic
+class Uwsgi(object):
+    def set_logvar(*args, **kwargs):
+        pass
+try:
+    import uwsgi
+except ImportError:
+    uwsgi = Uwsgi()
+
+
 def add_params_to_url(url, params):
     url_parts = list(urlparse.urlparse(url))
     query = dict(urlparse.parse_qsl(url_parts[4]))
@@ -39,3 +50,13 @@ def get_and_validate_state(request):
         app.logger.error('State {0} does not match {1}'.format(u(url_token), u(cookie_token)))
         return None
     return state
+
+
+def stream_template(template, **context):
+    """Render a template as a generator of chunks, so the first bytes go
+    out before lazy context like Rank.iter_leaderboard is exhausted.
+    """
+    app.update_template_context(context)
+    stream = app.jinja_env.get_template(template).stream(context)
+    stream.enable_buffering()
+    return stream
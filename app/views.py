@@ -7,13 +7,18 @@
 """
 
 
-import base64
-import pytz
-import requests
+import hashlib
+from datetime import datetime
 
-from app import auth, utils
+from sqlalchemy.exc import IntegrityError
+from werkzeug.http import is_resource_modified
+from werkzeug.urls import url_encode
+
+from app import auth, cache, snapshots, standings, tasks, utils, wakatime
+from app import json as app_json
 from app.forms import HackathonForm
 from app.models import db, User, Hackathon, Rank
+from app.querybudget import query_budget
 
 from flask import current_app as app
 from flask import (
@@ -21,9 +26,11 @@ from flask import (
     Blueprint,
     g,
     json,
+    jsonify,
     render_template,
     request,
     redirect,
+    stream_with_context,
 )
 
 
@@ -31,14 +38,16 @@ blueprint = Blueprint('views', __name__)
 
 
 @blueprint.route('/')
+@query_budget(4)
 def index():
-    context = {
-        'hackathons': Hackathon.query.all(),
-    }
-    return render_template('index.html', **context)
+
+    # sections depend on the time as well as on changes, so expire quickly
+    timeout = app.config['INDEX_CACHE_TIMEOUT']
+    return render_cached(cache.HACKATHONS_NAMESPACE, 'index.html', index_context, args=('section', 'after'), timeout=timeout)
 
 
 @blueprint.route('/login')
+@query_budget(0)
 def login():
     scope = 'email,read_logged_time'
     state = {
@@ -52,11 +61,12 @@ def login():
         'state': json.dumps(state),
         'scope': scope,
     }
-    url = 'https://wakatime.com/oauth/authorize'
+    url = app.config['WAKATIME_BASE_URL'] + '/oauth/authorize'
     return redirect(utils.add_params_to_url(url, params))
 
 
 @blueprint.route('/login/callback')
+@query_budget(2)
 def login_callback():
 
     # validate csrf token from state
@@ -72,19 +82,12 @@ def login_callback():
         abort(400)
 
     # get access token
-    data = {
-        'code': code,
-        'client_id': app.config['WAKATIME_CLIENT_ID'],
-        'client_secret': app.config['WAKATIME_SECRET'],
-        'redirect_uri': app.config['WAKATIME_REDIRECT_URI'],
-        'grant_type': 'authorization_code',
-    }
-    headers = {
-        'Accept': 'application/json',
-        'User-Agent': app.config['USER_AGENT'],
-    }
-    access_url = 'https://wakatime.com/oauth/token'
-    response = requests.post(access_url, data=data, headers=headers)
+    try:
+        response = wakatime.exchange_code(code)
+    except wakatime.RateLimited:
+        retry_later()
+    except wakatime.WakaTimeError:
+        abort(502)
 
     app.logger.debug(response.status_code)
     app.logger.debug(response.text)
@@ -99,12 +102,12 @@ def login_callback():
     app.logger.debug(access_token)
     app.logger.debug(scopes)
 
-    headers = {
-        'Accept': 'application/json',
-        'Authorization': 'Basic {0}'.format(base64.b64encode(access_token)),
-        'User-Agent': app.config['USER_AGENT'],
-    }
-    response = requests.get('https://wakatime.com/api/v1/users/current?token=' + access_token, headers=headers)
+    try:
+        response = wakatime.current_user(access_token)
+    except wakatime.RateLimited:
+        retry_later()
+    except wakatime.WakaTimeError:
+        abort(502)
 
     app.logger.debug(response.status_code)
     app.logger.debug(response.text)
@@ -113,20 +116,20 @@ def login_callback():
         app.logger.error(response.text)
         abort(400)
 
+    base_url = app.config['WAKATIME_BASE_URL']
     if response.json()['data']['username']:
-        profile_url = 'https://wakatime.com/@' + response.json()['data']['username']
+        profile_url = base_url + '/@' + response.json()['data']['username']
     else:
-        profile_url = 'https://wakatime.com/' + response.json()['data']['id']
-    defaults = {
-        'wakatime_token': access_token,
-        'email': response.json()['data']['email'],
-        'avatar_url': response.json()['data']['photo'],
-        'full_name': response.json()['data']['full_name'],
-        'username': response.json()['data']['username'],
-        'profile_url': profile_url,
-    }
-    user = User.get_or_create(defaults=defaults, wakatime_id=response.json()['data']['id'])
-    user.set_columns(**defaults)
+        profile_url = base_url + '/' + response.json()['data']['id']
+    user = User.upsert(
+        wakatime_id=response.json()['data']['id'],
+        wakatime_token=access_token,
+        email=response.json()['data']['email'],
+        avatar_url=response.json()['data']['photo'],
+        full_name=response.json()['data']['full_name'],
+        username=response.json()['data']['username'],
+        profile_url=profile_url,
+    )
     db.session.commit()
 
     auth.login_user(user)
@@ -137,69 +140,315 @@ def login_callback():
 
 
 @blueprint.route('/hackathon/<path:hackathon_name>')
+@query_budget(3)
 def hackathon(hackathon_name):
-    hackathon = Hackathon.query.filter_by(name=hackathon_name).first()
+    hackathon = Hackathon.resolve(hackathon_name)
+    if hackathon is None:
+        abort(404)
+
+    # ended hackathons never change, so send their frozen snapshot. It is
+    # rendered with the anonymous header, so logged in users get a page
+    # rendered, and cached, with their own
+    if hackathon.finalized_at is not None and not app.current_user.is_authenticated():
+        response = snapshots.serve(hackathon.id, snapshots.HTML_FILENAME, 'text/html')
+        if response is not None:
+            return response
+
+    # very large leaderboards are streamed instead of rendered and cached
+    top = request.args.get('top')
+    if top == 'all' or request.args.get('top', 0, type=int) > app.config['LEADERBOARD_MAX_TOP']:
+        context = {
+            'hackathon': hackathon,
+            'start': 0,
+            'next_url': None,
+            'hackers': Rank.iter_leaderboard(hackathon.id, limit=None if top == 'all' else int(top)),
+        }
+        return app.response_class(stream_with_context(utils.stream_template('hackathon.html', **context)))
+
+    # pages cached while coding is on must stop showing the join button
+    # when it ends
+    timeout = None
+    if not hackathon.has_ended():
+        timeout = min(app.config['CACHE_TIMEOUT'], int((hackathon.coding_ends_at - datetime.utcnow()).total_seconds()) + 1)
+
+    namespace = cache.hackathon_namespace(hackathon.id)
+    return render_cached(namespace, 'hackathon.html', lambda: leaderboard_context(hackathon), args=('top', 'after', 'start'), timeout=timeout)
+
+
+@blueprint.route('/hackathon/<path:hackathon_name>/leaderboard.json')
+@query_budget(3)
+def hackathon_leaderboard_json(hackathon_name):
+    """One page of a hackathon's leaderboard as JSON, paged like the html
+    view with `limit`, `after` and `start` query args. Responses carry an
+    ETag from the hackathon's cache version, which every rank change
+    bumps, so polling clients get a 304 without any query until then.
+    Without a version, when memcached is unreachable, there is no ETag and
+    every request gets the full page.
+    """
+    hackathon = Hackathon.resolve(hackathon_name)
     if hackathon is None:
         abort(404)
+    hackathon_id = hackathon.id
+
+    version = cache.get_version(cache.hackathon_namespace(hackathon_id))
+    etag = None
+    if version is not None:
+        etag = hashlib.md5(u':'.join([
+            unicode(hackathon_id),
+            unicode(version),
+            request.query_string.decode('utf-8', 'replace'),
+        ]).encode('utf-8')).hexdigest()
+    if etag is not None and not is_resource_modified(request.environ, etag=etag):
+        response = app.response_class(status=304)
+        return conditional(response, etag)
+
+    limit = request.args.get('limit', app.config['LEADERBOARD_PAGE_SIZE'], type=int)
+    if limit < 1:
+        limit = app.config['LEADERBOARD_PAGE_SIZE']
+    limit = min(limit, app.config['LEADERBOARD_MAX_TOP'])
+    after = Rank.parse_cursor(request.args.get('after'))
+    start = max(request.args.get('start', 0, type=int), 0) if after is not None else 0
+
+    hackers = Rank.leaderboard(hackathon_id, limit=limit + 1, after=after)
+    next_url = None
+    if len(hackers) > limit:
+        hackers = hackers[:limit]
+        params = {
+            'limit': limit,
+            'after': hackers[-1].cursor,
+            'start': start + limit,
+        }
+        next_url = utils.add_params_to_url(request.path, params)
 
+    data = {
+        'data': [{
+            'rank': start + i + 1,
+            'user_id': hacker.user_id,
+            'full_name': hacker.full_name,
+            'username': hacker.username,
+            'profile_url': hacker.profile_url,
+            'avatar_url': hacker.avatar_url,
+            'total_seconds': hacker.total_seconds,
+            'coding_time': hacker.coding_time,
+        } for i, hacker in enumerate(hackers)],
+        'total': db.session.query(Hackathon.participants_count).filter(Hackathon.id == hackathon_id).scalar(),
+        'next_url': next_url,
+    }
+    response = app.response_class(app_json.dumps(data), mimetype='application/json')
+    return conditional(response, etag)
+
+
+@blueprint.route('/hackathon/<path:hackathon_name>/snapshot.json')
+@query_budget(1)
+def hackathon_snapshot_json(hackathon_name):
+    """The final leaderboard of an ended hackathon, as compact json with
+    one list of `fields` per rank.
+    """
+    hackathon = Hackathon.resolve(hackathon_name)
+    if hackathon is None or hackathon.finalized_at is None:
+        abort(404)
+    response = snapshots.serve(hackathon.id, snapshots.JSON_FILENAME, 'application/json')
+    if response is None:
+        abort(404)
+    return response
+
+
+@blueprint.route('/hackathon/<path:hackathon_name>/position.json')
+@query_budget(4)
+@auth.login_required
+def hackathon_position_json(hackathon_name):
+    """The current user's place in a hackathon, with the `k` ranks above
+    and below theirs, so they need not page through the leaderboard to
+    find themselves. Places come from the hackathon's sorted board, see
+    app.standings, or from a window query when memcached is unavailable.
+    """
+    hackathon = Hackathon.resolve(hackathon_name)
+    if hackathon is None:
+        abort(404)
+
+    k = request.args.get('k', app.config['POSITION_NEIGHBOURS'], type=int)
+    k = min(max(k, 0), app.config['POSITION_MAX_NEIGHBOURS'])
+    user_id = app.current_user.id
+    hackers = standings.neighbourhood(hackathon.id, user_id, k)
+    if hackers is None:
+        hackers = Rank.neighbourhood(hackathon.id, user_id, k)
+    me = [hacker for hacker in hackers if hacker.user_id == user_id]
+
+    data = {
+        'position': me[0].position if me else None,
+        'total': me[0].participants_count if me else 0,
+        'data': [{
+            'rank': hacker.position,
+            'user_id': hacker.user_id,
+            'full_name': hacker.full_name,
+            'username': hacker.username,
+            'profile_url': hacker.profile_url,
+            'avatar_url': hacker.avatar_url,
+            'total_seconds': hacker.total_seconds,
+            'coding_time': hacker.coding_time,
+            'is_current_user': hacker.user_id == user_id,
+        } for hacker in hackers],
+    }
+    response = app.response_class(app_json.dumps(data), mimetype='application/json')
+    response.cache_control.private = True
+    response.cache_control.no_cache = True
+    return response
+
+
+@blueprint.route('/dashboard')
+@query_budget(2)
+@auth.login_required
+def dashboard():
     context = {
-        'hackathon': hackathon,
-        'hackers': hackathon.ranks.all(),
+        'standings': Rank.standings(app.current_user.id),
     }
-    return render_template('hackathon.html', **context)
+    return render_template('dashboard.html', **context)
+
+
+def retry_later(seconds=1):
+    """Abort with a 503 asking the client to try again after seconds.
+    """
+    response = app.response_class(u'Too many requests to WakaTime, please try again.', status=503, mimetype='text/plain')
+    response.headers['Retry-After'] = str(seconds)
+    abort(response)
+
+
+def conditional(response, etag):
+    """Set an ETag on a response, when there is one, and ask clients to
+    revalidate before reusing it.
+    """
+    if etag is not None:
+        response.set_etag(etag)
+    response.cache_control.no_cache = True
+    return response
 
 
 @blueprint.route('/hackathon/<path:hackathon_name>/join')
+@query_budget(13)
 @auth.login_required
 def hackathon_join(hackathon_name):
-    hackathon = Hackathon.query.filter_by(name=hackathon_name).first()
+    hackathon = Hackathon.resolve(hackathon_name)
     if hackathon is None:
         abort(404)
 
-    headers = {
-        'Accept': 'application/json',
-        'User-Agent': app.config['USER_AGENT'],
-    }
-    timezone = pytz.timezone(hackathon.timezone)
-    params = {
-        'start': hackathon.coding_starts_at.replace(tzinfo=pytz.utc).astimezone(timezone).strftime('%m/%d/%Y'),
-        'end': hackathon.coding_ends_at.replace(tzinfo=pytz.utc).astimezone(timezone).strftime('%m/%d/%Y'),
-        'token': app.current_user.wakatime_token,
-    }
-    response = requests.get('https://wakatime.com/api/v1/users/current/summaries', headers=headers, params=params)
+    # ranks only count coding time inside the window, and final standings
+    # are frozen
+    if hackathon.has_ended():
+        abort(403)
 
-    app.logger.debug(response.status_code)
-    app.logger.debug(response.text)
+    result = tasks.join_hackathon.delay(unicode(app.current_user.id), unicode(hackathon.id))
 
-    if response.status_code != 200:
-        abort(400)
+    context = leaderboard_context(hackathon)
+    if not result.ready():
+        context['job_id'] = result.id
+    return render_template('hackathon.html', **context)
 
-    total_seconds = 0
-    for day in response.json()['data']:
-        total_seconds += day['grand_total']['total_seconds']
 
-    defaults = {
-        'total_seconds': total_seconds,
-    }
-    rank = Rank.get_or_create(defaults=defaults, hackathon_id=hackathon.id, user_id=app.current_user.id)
-    rank.set_columns(**defaults)
-    db.session.commit()
+@blueprint.route('/jobs/<job_id>')
+@query_budget(0)
+def job_status(job_id):
+    result = tasks.celery.AsyncResult(job_id)
+    return jsonify(id=job_id, status=result.state, ready=result.ready())
+
+
+def render_cached(namespace, template, get_context, args=(), timeout=None):
+    """Render a template, or return it from the cache if this namespace
+    has not changed since it was last rendered. The page varies with the
+    query args named in `args`, the ones get_context reads, and the header
+    with login state, so those make up the key. Other query args are
+    ignored, so they can not fill the cache with copies of one page.
+    """
+    params = url_encode(dict((name, request.args.get(name)) for name in args), sort=True)
+    key = cache.versioned_key(namespace, request.path, app.current_user.is_authenticated(), params)
+    html = cache.get(key)
+    if html is None:
+        html = render_template(template, **get_context())
+        cache.set(key, html, timeout=timeout)
+    return html
+
+
+def index_context():
+    """Build the template context for the index, with the first page of
+    each listing section, or the page of one section from the `section`
+    and `after` query args.
+    """
+    limit = app.config['INDEX_PAGE_SIZE']
+    now = datetime.utcnow()
+    sections = Hackathon.LISTING_SECTIONS
+    after = None
+    if request.args.get('section') in sections:
+        sections = [request.args.get('section')]
+        after = Hackathon.parse_cursor(request.args.get('after'))
 
+    context = {
+        'sections': [],
+    }
+    for section in sections:
+        hackathons = Hackathon.listing(section, limit=limit + 1, after=after, now=now)
+        next_url = None
+        if len(hackathons) > limit:
+            hackathons = hackathons[:limit]
+            params = {
+                'section': section,
+                'after': hackathons[-1].cursor,
+            }
+            next_url = utils.add_params_to_url('/', params)
+        context['sections'].append({
+            'name': section,
+            'hackathons': hackathons,
+            'next_url': next_url,
+        })
+    return context
+
+
+def leaderboard_context(hackathon):
+    """Build the template context for one page of a hackathon's
+    leaderboard, from the `top`, `after` and `start` query args. Takes a
+    Hackathon or HackathonRef.
+    """
     context = {
         'hackathon': hackathon,
+        'start': 0,
+        'next_url': None,
     }
-    return render_template('hackathon.html', **context)
+
+    top = request.args.get('top', type=int)
+    if top and top > 0:
+        context['hackers'] = Rank.leaderboard(hackathon.id, limit=min(top, app.config['LEADERBOARD_MAX_TOP']))
+        return context
+
+    limit = app.config['LEADERBOARD_PAGE_SIZE']
+    after = Rank.parse_cursor(request.args.get('after'))
+    if after is not None:
+        context['start'] = max(request.args.get('start', 0, type=int), 0)
+
+    hackers = Rank.leaderboard(hackathon.id, limit=limit + 1, after=after)
+    if len(hackers) > limit:
+        hackers = hackers[:limit]
+        params = {
+            'after': hackers[-1].cursor,
+            'start': context['start'] + limit,
+        }
+        context['next_url'] = utils.add_params_to_url('/hackathon/' + hackathon.name, params)
+    context['hackers'] = hackers
+    return context
 
 
 @blueprint.route('/new/hackathon', methods=['GET', 'POST'])
+@query_budget(4)
 @auth.login_required
 def create_hackathon():
     form = HackathonForm(request.form)
     if request.method == 'POST' and form.validate():
-        hackathon = Hackathon(admin_id=app.current_user.id, **form.data)
-        db.session.add(hackathon)
-        db.session.commit()
-        return redirect('/hackathon/'+hackathon.name)
+        if Hackathon.resolve(form.name.data) is None:
+            hackathon = Hackathon(admin_id=app.current_user.id, **form.data)
+            db.session.add(hackathon)
+            try:
+                db.session.commit()
+                return redirect('/hackathon/'+hackathon.name)
+            except IntegrityError:
+                db.session.rollback()
+        form.name.errors.append(u'A hackathon with this name already exists.')
     context = {
         'form': form,
     }
@@ -0,0 +1,153 @@
+# -*- coding: utf-8 -*-
+"""
+    hackathonranks.wakatime
+    ~~~~~~~~~~~~~~~~~~~~~~~
+
+    Client for the WakaTime api, shared by views and background jobs.
+
+    Each process keeps one requests.Session with a pool of keep-alive
+    connections, so calls reuse TCP and TLS connections instead of opening
+    new ones. Every call has connect and read timeouts, and idempotent
+    calls are retried with backoff on connection errors, 429 and 5xx.
+    Calls made while a web request waits get fewer retries and a shorter
+    read timeout than background jobs.
+    Calls from all processes share one WAKATIME_RATE_LIMIT per second.
+"""
+
+
+import base64
+import os
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+from requests.packages.urllib3.util.retry import Retry
+
+from app import app, metrics
+from app.ratelimit import TokenBucketRateLimiter
+
+from flask import has_request_context
+
+
+class WakaTimeError(Exception):
+    """Raised when WakaTime can not be reached or keeps failing after
+    retries.
+    """
+
+
+class RateLimited(WakaTimeError):
+    """Raised when the rate limit allowed no call in time, so trying again
+    shortly should work.
+    """
+
+
+# sessions by number of retries, for the process in _sessions_pid
+_sessions = {}
+_sessions_pid = None
+
+limiter = None
+if app.config['WAKATIME_RATE_LIMIT']:
+    limiter = TokenBucketRateLimiter('wakatime', app.config['WAKATIME_RATE_LIMIT'])
+
+
+def get_session(retries=None):
+    """Return this process's session retrying calls `retries` times,
+    creating new sessions after a fork so uwsgi and celery workers never
+    share pooled sockets.
+    """
+    global _sessions_pid
+    if retries is None:
+        retries = app.config['WAKATIME_RETRIES']
+    if _sessions_pid != os.getpid():
+        _sessions.clear()
+        _sessions_pid = os.getpid()
+    session = _sessions.get(retries)
+    if session is None:
+        adapter = HTTPAdapter(
+            pool_connections=1,
+            pool_maxsize=app.config['WAKATIME_POOL_SIZE'],
+            max_retries=Retry(
+                total=retries,
+                backoff_factor=app.config['WAKATIME_BACKOFF_FACTOR'],
+                status_forcelist=[429, 500, 502, 503, 504],
+            ),
+        )
+        session = requests.Session()
+        session.mount('https://', adapter)
+        session.mount('http://', adapter)
+        _sessions[retries] = session
+    return session
+
+
+def close_sessions():
+    for session in _sessions.values():
+        session.close()
+    _sessions.clear()
+
+
+def get_headers(access_token=None):
+    headers = {
+        'Accept': 'application/json',
+        'User-Agent': app.config['USER_AGENT'],
+    }
+    if access_token:
+        headers['Authorization'] = 'Basic {0}'.format(base64.b64encode(access_token))
+    return headers
+
+
+def request(method, path, access_token=None, **kwargs):
+
+    # views only wait briefly, for the rate limit and for WakaTime, so a
+    # burst of logins or a slow api never ties up every web worker, while
+    # background jobs wait their turn and retry more
+    retries = app.config['WAKATIME_RETRIES']
+    read_timeout = app.config['WAKATIME_READ_TIMEOUT']
+    rate_limit_timeout = app.config['WAKATIME_RATE_LIMIT_TIMEOUT']
+    if has_request_context():
+        retries = app.config['WAKATIME_REQUEST_RETRIES']
+        read_timeout = app.config['WAKATIME_REQUEST_READ_TIMEOUT']
+        rate_limit_timeout = app.config['WAKATIME_RATE_LIMIT_REQUEST_TIMEOUT']
+
+    kwargs.setdefault('headers', get_headers(access_token=access_token))
+    kwargs.setdefault('timeout', (app.config['WAKATIME_CONNECT_TIMEOUT'], read_timeout))
+    if access_token:
+        params = kwargs.setdefault('params', {})
+        params['token'] = access_token
+
+    if limiter is not None and not limiter.acquire(timeout=rate_limit_timeout):
+        app.logger.error(u'WakaTime {0} {1} rate limited.'.format(method, path))
+        raise RateLimited('Rate limited')
+    started = time.time()
+    try:
+        return get_session(retries).request(method, app.config['WAKATIME_BASE_URL'] + path, **kwargs)
+    except requests.RequestException as e:
+        app.logger.error(u'WakaTime {0} {1} failed: {2}'.format(method, path, e))
+        raise WakaTimeError(e)
+    finally:
+        metrics.record_http(time.time() - started)
+
+
+def exchange_code(code):
+    """Exchange an OAuth authorization code for an access token. POSTs are
+    not retried, because a code can only be used once.
+    """
+    data = {
+        'code': code,
+        'client_id': app.config['WAKATIME_CLIENT_ID'],
+        'client_secret': app.config['WAKATIME_SECRET'],
+        'redirect_uri': app.config['WAKATIME_REDIRECT_URI'],
+        'grant_type': 'authorization_code',
+    }
+    return request('POST', '/oauth/token', data=data)
+
+
+def current_user(access_token):
+    return request('GET', '/api/v1/users/current', access_token=access_token)
+
+
+def summaries(access_token, start, end):
+    params = {
+        'start': start,
+        'end': end,
+    }
+    return request('GET', '/api/v1/users/current/summaries', access_token=access_token, params=params)
@@ -0,0 +1,113 @@
+# -*- coding: utf-8 -*-
+"""
+    benchmarks.database
+    ~~~~~~~~~~~~~~~~~~~
+
+    Setting up and seeding a scratch database for benchmarks, either a
+    local Postgres or an in-memory SQLite stand-in with UUID columns stored
+    as CHAR(36).
+"""
+
+
+import logging
+import uuid
+from datetime import datetime
+
+from sqlalchemy import event
+from sqlalchemy.dialects.postgresql import UUID
+from sqlalchemy.ext.compiler import compiles
+
+from app import app, cache
+from app.models import db, Hackathon, Rank, User
+
+
+# rows per INSERT statement when seeding
+SEED_CHUNK_SIZE = 5000
+
+
+@compiles(UUID, 'sqlite')
+def compile_uuid_for_sqlite(element, compiler, **kwargs):
+    return 'CHAR(36)'
+
+
+def setup(database_url):
+    """Point the app at a fresh database and a process local cache. Drops
+    every table first, so never use a real database.
+    """
+    app.config['SQLALCHEMY_DATABASE_URI'] = database_url
+    app.config['CSRF_DISABLE'] = True
+    app.jinja_env.compressor_offline_compress = True
+    app.logger.setLevel(logging.WARNING)
+    cache.client = cache.LocalClient()
+    if database_url.startswith('sqlite'):
+        use_sqlite_savepoints()
+    db.drop_all()
+    db.create_all()
+
+
+def use_sqlite_savepoints():
+    """pysqlite starts transactions itself and loses track of savepoints, so
+    let SQLAlchemy emit BEGIN instead, for begin_nested to work.
+    """
+    def connect(dbapi_connection, connection_record):
+        dbapi_connection.isolation_level = None
+
+    def begin(conn):
+        # straight on the driver, so QueryRecorder does not count it
+        conn.connection.connection.execute('BEGIN')
+
+    event.listen(db.engine, 'connect', connect)
+    event.listen(db.engine, 'begin', begin)
+    db.engine.dispose()
+
+
+def insert_chunked(table, rows):
+    for offset in range(0, len(rows), SEED_CHUNK_SIZE):
+        db.session.execute(table.insert(), rows[offset:offset + SEED_CHUNK_SIZE])
+
+
+def seed_hackathon(name, participants, coding_starts_at, coding_ends_at, admin_id=None):
+    """Insert a hackathon with a User and Rank for each participant, using
+    bulk inserts. Returns the hackathon id and participants' user ids,
+    highest ranked first.
+    """
+    now = datetime.utcnow()
+    prefix = uuid.uuid4().hex[:8]
+    users = [{
+        'id': uuid.uuid4(),
+        'email': u'{0}-hacker{1}@localhost'.format(prefix, i),
+        'wakatime_id': u'{0}-{1}'.format(prefix, i),
+        'wakatime_token': u'token',
+        'username': u'{0}-hacker{1}'.format(prefix, i),
+        'full_name': u'Hacker {0}'.format(i),
+        'profile_url': u'https://wakatime.com/@{0}-hacker{1}'.format(prefix, i),
+        'created_at': now,
+    } for i in range(participants)]
+    insert_chunked(User.__table__, users)
+
+    if admin_id is None:
+        admin_id = users[0]['id'] if users else None
+    hackathon_id = uuid.uuid4()
+    db.session.execute(Hackathon.__table__.insert(), [{
+        'id': hackathon_id,
+        'admin_id': admin_id,
+        'name': name,
+        'coding_starts_at': coding_starts_at,
+        'coding_ends_at': coding_ends_at,
+        'timezone': u'UTC',
+        'participants_count': 0,
+        'total_seconds': 0,
+        'created_at': now,
+    }])
+
+    ranks = [{
+        'id': uuid.uuid4(),
+        'user_id': user['id'],
+        'hackathon_id': hackathon_id,
+        'total_seconds': (participants - i) * 60,
+        'created_at': now,
+    } for i, user in enumerate(users)]
+    insert_chunked(Rank.__table__, ranks)
+    Hackathon.update_counters([hackathon_id])
+    db.session.commit()
+    return hackathon_id, [user['id'] for user in users]
@@ -0,0 +1,204 @@
+# -*- coding: utf-8 -*-
+"""
+    benchmarks.fake_wakatime
+    ~~~~~~~~~~~~~~~~~~~~~~~~
+
+    Local stand-in for the parts of the WakaTime api the app uses, so
+    benchmarks and load tests never touch the real one.
+
+    Any OAuth code is exchanged for a token, and each token is a different
+    user, so a load test can log in as many users as it likes. Responses
+    can be slowed down, made to fail at random with a 500, and padded with
+    extra projects per day to test larger payloads.
+
+    Run it on its own, and start the app with WAKATIME_BASE_URL pointing
+    at it::
+
+        python -m benchmarks.fake_wakatime --port 8001 --latency 0.2 --error-rate 0.01
+        WAKATIME_BASE_URL=http://127.0.0.1:8001 uwsgi --master --http 127.0.0.1:5000 --wsgi-file application.wsgi --processes 4 --threads 2
+"""
+
+
+import argparse
+import base64
+import hashlib
+import json
+import random
+import threading
+import time
+import urllib
+import urlparse
+from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+from SocketServer import ThreadingMixIn
+from datetime import datetime, timedelta
+
+
+class FakeWakaTimeHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+        url = urlparse.urlparse(self.path)
+        params = dict(urlparse.parse_qsl(url.query))
+        if self.slow_or_failing():
+            return
+        token = params.get('token') or self.basic_token()
+        if url.path.startswith('/api/') and not token:
+            self.send_json(401, {'error': 'Unauthorized'})
+        elif url.path == '/api/v1/users/current':
+            self.send_json(200, {'data': self.user(token)})
+        elif url.path == '/api/v1/users/current/summaries':
+            self.send_json(200, self.summaries(params))
+        elif url.path == '/oauth/authorize':
+            self.authorize(params)
+        else:
+            self.send_json(404, {'error': 'Not found'})
+
+    def do_POST(self):
+        url = urlparse.urlparse(self.path)
+        length = int(self.headers.get('Content-Length') or 0)
+        form = dict(urlparse.parse_qsl(self.rfile.read(length)))
+        if self.slow_or_failing():
+            return
+        if url.path == '/oauth/token':
+            if not form.get('code'):
+                self.send_json(400, {'error': 'invalid_grant'})
+                return
+            self.send_json(200, {
+                'access_token': 'token-' + form['code'],
+                'refresh_token': 'refresh-' + form['code'],
+                'token_type': 'bearer',
+                'scope': 'email,read_logged_time',
+                'expires_in': 60 * 60 * 24 * 365,
+            })
+        else:
+            self.send_json(404, {'error': 'Not found'})
+
+    def slow_or_failing(self):
+        """Sleep for the server's latency, then send a 500 and return True
+        for the server's error rate of requests.
+        """
+        time.sleep(self.server.latency)
+        if self.server.error_rate and random.random() < self.server.error_rate:
+            self.send_json(500, {'error': 'Internal server error'})
+            return True
+        return False
+
+    def basic_token(self):
+        header = self.headers.get('Authorization') or ''
+        if not header.startswith('Basic '):
+            return None
+        try:
+            return base64.b64decode(header[len('Basic '):])
+        except TypeError:
+            return None
+
+    def authorize(self, params):
+        """Approve straight away, redirecting back with a random code.
+        """
+        code = 'code-{0}'.format(random.randint(0, 10 ** 9))
+        separator = '&' if '?' in params.get('redirect_uri', '') else '?'
+        location = '{0}{1}code={2}&state={3}'.format(
+            params.get('redirect_uri', '/'),
+            separator,
+            code,
+            urllib.quote(params.get('state', '')),
+        )
+        self.send_response(302)
+        self.send_header('Location', location)
+        self.send_header('Content-Length', '0')
+        self.end_headers()
+
+    def user(self, token):
+        user_id = hashlib.md5(token).hexdigest()
+        return {
+            'id': '{0}-{1}-{2}-{3}-{4}'.format(user_id[:8], user_id[8:12], user_id[12:16], user_id[16:20], user_id[20:]),
+            'email': '{0}@localhost'.format(user_id),
+            'username': 'hacker-{0}'.format(user_id[:12]),
+            'full_name': 'Hacker {0}'.format(user_id[:6]),
+            'photo': 'https://wakatime.com/photo/{0}'.format(user_id),
+        }
+
+    def summaries(self, params):
+        start = datetime.strptime(params['start'], '%m/%d/%Y').date()
+        end = datetime.strptime(params['end'], '%m/%d/%Y').date()
+        data = []
+        day = start
+        while day <= end:
+            total_seconds = random.randint(0, 60 * 60 * 12)
+            data.append({
+                'grand_total': {
+                    'total_seconds': total_seconds,
+                },
+                'projects': [{
+                    'name': 'project-{0}'.format(i),
+                    'total_seconds': total_seconds // (i + 2),
+                    'percent': round(100.0 / (i + 2), 2),
+                } for i in range(self.server.payload_size)],
+                'range': {
+                    'date': day.strftime('%Y-%m-%d'),
+                },
+            })
+            day += timedelta(days=1)
+        return {'data': data}
+
+    def send_json(self, status, data):
+        body = json.dumps(data)
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class FakeWakaTimeServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+    request_queue_size = 128
+
+    def __init__(self, address, latency=0.0, error_rate=0.0, payload_size=0):
+        HTTPServer.__init__(self, address, FakeWakaTimeHandler)
+        self.latency = latency
+        self.error_rate = error_rate
+        self.payload_size = payload_size
+
+    @property
+    def url(self):
+        return 'http://{0}:{1}'.format(*self.server_address)
+
+
+def start_server(host='127.0.0.1', port=0, latency=0.0, error_rate=0.0, payload_size=0):
+    """Serve in a background thread, returning the server.
+    """
+    server = FakeWakaTimeServer((host, port), latency=latency, error_rate=error_rate, payload_size=payload_size)
+    thread = threading.Thread(target=server.serve_forever)
+    thread.daemon = True
+    thread.start()
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Serve a fake WakaTime api.')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8001)
+    parser.add_argument('--latency', type=float, default=0.0, help='seconds added to each response')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='fraction of requests answered with a 500')
+    parser.add_argument('--payload-size', type=int, default=0, help='projects per day in summaries')
+    args = parser.parse_args()
+
+    server = FakeWakaTimeServer(
+        (args.host, args.port),
+        latency=args.latency,
+        error_rate=args.error_rate,
+        payload_size=args.payload_size,
+    )
+    print('serving on {0}'.format(server.url))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,108 @@
+#!/usr/bin/env python
+"""
+    benchmarks.json_encoding
+    ~~~~~~~~~~~~~~~~~~~~~~~~
+
+    CustomJSONEncoder compared with the isinstance based encoder it
+    replaced, on leaderboard sized payloads of dicts with datetimes, dates
+    and UUIDs. Also times streaming the same payload with iterencode.
+
+    Usage::
+
+        python -m benchmarks.json_encoding --count 10000
+"""
+
+
+import argparse
+import datetime
+import json
+import sys
+import timeit
+import uuid
+
+import pytz
+from flask.json import JSONEncoder
+from sqlalchemy.dialects.postgresql import UUID
+
+from app import json as app_json
+
+
+class LegacyJSONEncoder(JSONEncoder):
+    """CustomJSONEncoder before the dispatch table, for comparison.
+    """
+
+    def default(self, o):
+        if isinstance(o, datetime.datetime):
+            if o.tzinfo is not None:
+                o = o.astimezone(pytz.utc)
+            return o.strftime('%Y-%m-%dT%H:%M:%SZ')
+        if isinstance(o, datetime.time):
+            return o.strftime('%I:%M%p').lstrip('0').lower()
+        if isinstance(o, datetime.date):
+            return o.strftime('%m/%d/%Y')
+        if isinstance(o, uuid.UUID) or isinstance(o, UUID):
+            return unicode(o)
+        return JSONEncoder.default(self, o)
+
+
+def make_payload(count):
+    """Rows like a leaderboard page, where many rows share timestamps
+    because ranks are refreshed in batches.
+    """
+    start = datetime.datetime(2015, 3, 1, 12, 0, 0)
+    hackathon_id = uuid.uuid4()
+    rows = []
+    for i in range(count):
+        rows.append({
+            'id': uuid.uuid4(),
+            'user_id': uuid.uuid4(),
+            'hackathon_id': hackathon_id,
+            'total_seconds': i * 37,
+            'username': u'hacker{0}'.format(i),
+            'created_at': start + datetime.timedelta(seconds=i),
+            'modified_at': start + datetime.timedelta(minutes=10 * (i % 6)),
+            'date': start.date() + datetime.timedelta(days=i % 3),
+        })
+    return {'data': rows}
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark JSON encoding.')
+    parser.add_argument('--count', type=int, default=10000)
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--output', help='write results as json to this file')
+    args = parser.parse_args()
+
+    payload = make_payload(args.count)
+    legacy_encoder = LegacyJSONEncoder(separators=(',', ':'))
+
+    legacy_output = legacy_encoder.encode(payload)
+    if app_json.dumps(payload) != legacy_output:
+        print('dumps output differs from legacy encoder')
+        return 1
+    if u''.join(app_json.iterencode(payload)) != legacy_output:
+        print('iterencode output differs from legacy encoder')
+        return 1
+
+    legacy = min(timeit.repeat(lambda: legacy_encoder.encode(payload), number=1, repeat=args.repeat))
+    dispatch = min(timeit.repeat(lambda: app_json.dumps(payload), number=1, repeat=args.repeat))
+    streamed = min(timeit.repeat(lambda: list(app_json.iterencode(payload)), number=1, repeat=args.repeat))
+    results = {
+        'backend': app_json.backend,
+        'count': args.count,
+        'legacy_seconds': round(legacy, 4),
+        'dumps_seconds': round(dispatch, 4),
+        'iterencode_seconds': round(streamed, 4),
+        'speedup': round(legacy / dispatch, 2),
+    }
+    print('backend {backend}: legacy {legacy_seconds}s, dumps {dumps_seconds}s ({speedup}x), '
+          'iterencode {iterencode_seconds}s'.format(**results))
+
+    if args.output:
+        with open(args.output, 'w') as fh:
+            json.dump(results, fh, indent=2)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
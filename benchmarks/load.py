@@ -0,0 +1,188 @@
+#!/usr/bin/env python
+"""
+    benchmarks.load
+    ~~~~~~~~~~~~~~~
+
+    Load generator for end to end capacity tests of a running app, reporting
+    throughput and latency percentiles per kind of request.
+
+    Concurrent workers mix anonymous page views with joins, where a new
+    user logs in through the OAuth callback and joins a hackathon. Point
+    the app at benchmarks.fake_wakatime with WAKATIME_BASE_URL first, so
+    logins and the join jobs' summaries never reach the real WakaTime.
+    Start uwsgi from the repo root, since application.wsgi activates the
+    virtualenv in ./venv.
+
+    Usage::
+
+        python -m benchmarks.fake_wakatime --port 8001 --latency 0.2
+        WAKATIME_BASE_URL=http://127.0.0.1:8001 uwsgi --master --http 127.0.0.1:5000 --wsgi-file application.wsgi --processes 4 --threads 2
+        WAKATIME_BASE_URL=http://127.0.0.1:8001 celery -A app.tasks worker
+        python -m benchmarks.load --url http://127.0.0.1:5000 --hackathon "Some Hackathon" --concurrency 32 --duration 60
+"""
+
+
+import argparse
+import json
+import random
+import sys
+import threading
+import time
+import urllib
+import urlparse
+import uuid
+from collections import defaultdict
+
+import requests
+
+
+class Stats(object):
+    """Latencies and failures per kind of request, shared by all workers.
+    """
+
+    def __init__(self):
+        self.latencies = defaultdict(list)
+        self.errors = defaultdict(int)
+        self._lock = threading.Lock()
+
+    def record(self, name, seconds, ok):
+        with self._lock:
+            self.latencies[name].append(seconds)
+            if not ok:
+                self.errors[name] += 1
+
+    def summary(self, elapsed):
+        latencies = dict(self.latencies)
+        latencies['all'] = [s for name in self.latencies for s in self.latencies[name]]
+        errors = dict(self.errors)
+        errors['all'] = sum(self.errors.values())
+        results = []
+        for name in sorted(latencies):
+            times = sorted(latencies[name])
+            if not times:
+                continue
+            results.append({
+                'name': name,
+                'requests': len(times),
+                'errors': errors.get(name, 0),
+                'requests_per_second': round(len(times) / elapsed, 2),
+                'p50_ms': round(percentile(times, 50) * 1000, 1),
+                'p90_ms': round(percentile(times, 90) * 1000, 1),
+                'p99_ms': round(percentile(times, 99) * 1000, 1),
+                'max_ms': round(times[-1] * 1000, 1),
+            })
+        return results
+
+
+def percentile(times, percent):
+    """Nearest rank percentile of an already sorted list.
+    """
+    index = int(round(percent / 100.0 * len(times) + 0.5)) - 1
+    return times[max(0, min(index, len(times) - 1))]
+
+
+class Worker(threading.Thread):
+    """Sends requests until the shared deadline, joining with a new user
+    for join_ratio of iterations and viewing a random page otherwise.
+    """
+
+    def __init__(self, url, paths, join_path, join_ratio, deadline, stats):
+        super(Worker, self).__init__()
+        self.daemon = True
+        self.url = url
+        self.paths = paths
+        self.join_path = join_path
+        self.join_ratio = join_ratio
+        self.deadline = deadline
+        self.stats = stats
+        self.session = requests.Session()
+
+    def run(self):
+        while time.time() < self.deadline:
+            if random.random() < self.join_ratio:
+                self.log_in_and_join()
+            else:
+                name, path = random.choice(self.paths)
+                self.get(self.session, name, path)
+
+    def get(self, session, name, path, params=None, expect=(200,)):
+        started = time.time()
+        try:
+            response = session.get(self.url + path, params=params, allow_redirects=False, timeout=60)
+            response.content
+        except requests.RequestException:
+            self.stats.record(name, time.time() - started, False)
+            return None
+        self.stats.record(name, time.time() - started, response.status_code in expect)
+        return response
+
+    def log_in_and_join(self):
+        """Log in as a user the fake WakaTime has never seen, then join.
+        """
+        session = requests.Session()
+        response = self.get(session, 'login', '/login', expect=(302,))
+        if response is None or response.status_code != 302:
+            return
+        query = urlparse.urlparse(response.headers['Location']).query
+        state = dict(urlparse.parse_qsl(query)).get('state')
+        params = {
+            'code': uuid.uuid4().hex,
+            'state': state,
+        }
+        response = self.get(session, 'login_callback', '/login/callback', params=params, expect=(302,))
+        if response is not None and response.status_code == 302:
+            self.get(session, 'join', self.join_path)
+        session.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Generate join and view traffic against a running app.')
+    parser.add_argument('--url', default='http://127.0.0.1:5000', help='base url of the app')
+    parser.add_argument('--hackathon', required=True, help='name of an existing hackathon to view and join')
+    parser.add_argument('--concurrency', type=int, default=16)
+    parser.add_argument('--duration', type=float, default=30, help='seconds to send requests for')
+    parser.add_argument('--join-ratio', type=float, default=0.1, help='fraction of iterations that log in and join')
+    parser.add_argument('--output', help='write results as json to this file')
+    args = parser.parse_args()
+
+    url = args.url.rstrip('/')
+    hackathon_path = '/hackathon/' + urllib.quote(args.hackathon.encode('utf-8'))
+    paths = [
+        ('index', '/'),
+        ('hackathon', hackathon_path),
+        ('leaderboard_json', hackathon_path + '/leaderboard.json'),
+    ]
+
+    stats = Stats()
+    started = time.time()
+    deadline = started + args.duration
+    workers = [
+        Worker(url, paths, hackathon_path + '/join', args.join_ratio, deadline, stats)
+        for _ in range(args.concurrency)
+    ]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    elapsed = time.time() - started
+
+    results = stats.summary(elapsed)
+    print('{0:<18} {1:>8} {2:>7} {3:>9} {4:>9} {5:>9} {6:>9} {7:>9}'.format(
+        'request', 'count', 'errors', 'req/s', 'p50 ms', 'p90 ms', 'p99 ms', 'max ms'))
+    for result in results:
+        print('{name:<18} {requests:>8} {errors:>7} {requests_per_second:>9.1f} {p50_ms:>9.1f} {p90_ms:>9.1f} {p99_ms:>9.1f} {max_ms:>9.1f}'.format(**result))
+
+    if args.output:
+        with open(args.output, 'w') as fh:
+            json.dump({
+                'url': url,
+                'concurrency': args.concurrency,
+                'duration': round(elapsed, 2),
+                'join_ratio': args.join_ratio,
+                'results': results,
+            }, fh, indent=2)
+    return 1 if any(result['errors'] for result in results) else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,167 @@
+#!/usr/bin/env python
+"""
+    benchmarks.query_budget
+    ~~~~~~~~~~~~~~~~~~~~~~~
+
+    Requests every view against a seeded database, counting the SQL
+    statements each one runs. Exits 1 when a view goes over the budget it
+    declares with app.querybudget.query_budget, or repeats a statement with
+    different parameters, the usual sign of an N+1 lazy load. Caches are
+    emptied before each request, so budgets hold for cold caches.
+
+    Runs against a local Postgres, or by default an in-memory SQLite
+    database with UUID columns stored as CHAR(36).
+
+    Usage::
+
+        python -m benchmarks.query_budget --participants 200
+        python -m benchmarks.query_budget --database-url postgresql://localhost/hackathonranks_test
+"""
+
+
+import argparse
+import json
+import shutil
+import sys
+import tempfile
+from datetime import date, datetime, timedelta
+
+from app import app, auth, cache, snapshots, standings, tasks, wakatime
+from app.models import db, hackathon_refs, DailyTotal, Hackathon
+from app.querybudget import QueryRecorder
+
+from benchmarks.database import seed_hackathon, setup
+from benchmarks.fake_wakatime import start_server
+
+
+# (method, url, logged in) for each request to check
+REQUESTS = [
+    ('GET', '/', False),
+    ('GET', '/?section=past', False),
+    ('GET', '/hackathon/budget', False),
+    ('GET', '/hackathon/budget', True),
+    ('GET', '/hackathon/budget?top=20', False),
+    ('GET', '/hackathon/budget?top=all', False),
+    ('GET', '/hackathon/budget/leaderboard.json', False),
+    ('GET', '/hackathon/budget/position.json', True),
+    ('GET', '/hackathon/budget/join', True),
+    ('GET', '/hackathon/budget past', False),
+    ('GET', '/hackathon/budget past', True),
+    ('GET', '/hackathon/budget past/snapshot.json', False),
+    ('GET', '/hackathon/budget past/join', True),
+    ('GET', '/dashboard', True),
+    ('GET', '/new/hackathon', True),
+    ('GET', '/login', False),
+    ('GET', '/jobs/4f1c1f0e-6b0a-4c3e-9d55-3f2b8f1f2a10', False),
+    ('GET', '/metrics', False),
+]
+
+
+def seed(participants):
+    now = datetime.utcnow()
+    hackathon_id, user_ids = seed_hackathon(
+        u'budget',
+        participants,
+        coding_starts_at=now - timedelta(days=1),
+        coding_ends_at=now + timedelta(days=1),
+    )
+    past_id, _ = seed_hackathon(
+        u'budget past',
+        0,
+        coding_starts_at=now - timedelta(days=30),
+        coding_ends_at=now - timedelta(days=29),
+        admin_id=user_ids[0],
+    )
+    for i, user_id in enumerate(user_ids):
+        db.session.add(DailyTotal(user_id=user_id, date=date.today(), total_seconds=i * 60))
+    db.session.commit()
+    snapshots.finalize(Hackathon.query.get(past_id), refresh=False)
+    return unicode(user_ids[0])
+
+
+def clear_caches():
+    """Empty the cache and every per-process cache, so each request is
+    counted as it runs on a fresh worker.
+    """
+    cache.client.flush_all()
+    hackathon_refs.clear()
+    auth.user_snapshots.clear()
+    standings.boards.clear()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Check per view SQL query budgets.')
+    parser.add_argument('--database-url', default='sqlite://')
+    parser.add_argument('--participants', type=int, default=100)
+    parser.add_argument('--output', help='write results as json to this file')
+    args = parser.parse_args()
+
+    setup(args.database_url)
+    app.config['SNAPSHOT_DIR'] = tempfile.mkdtemp()
+    tasks.celery.conf.CELERY_ALWAYS_EAGER = True
+    server = start_server()
+    app.config['WAKATIME_BASE_URL'] = server.url
+    wakatime.limiter = None
+    user_id = seed(args.participants)
+
+    client = app.test_client()
+    adapter = app.url_map.bind('localhost')
+    results = []
+    failed = False
+    for method, url, logged_in in REQUESTS:
+        with client.session_transaction() as session:
+            session.clear()
+            if logged_in:
+                session['user_id'] = user_id
+                session['_fresh'] = True
+
+        endpoint = adapter.match(url.split('?')[0], method)[0]
+        budget = getattr(app.view_functions[endpoint], 'query_budget', None)
+        clear_caches()
+        with QueryRecorder() as recorder:
+            response = client.open(url, method=method)
+
+            # streamed responses run their queries while being read
+            response.get_data()
+
+        problems = recorder.problems(budget)
+        if response.status_code >= 500:
+            problems.append(u'returned {0}'.format(response.status_code))
+        failed = failed or bool(problems)
+        results.append({
+            'endpoint': endpoint,
+            'url': url,
+            'logged_in': logged_in,
+            'queries': len(recorder.statements),
+            'budget': budget,
+            'problems': problems,
+        })
+        print(u'{status:<4} {endpoint:<36} {queries:>3}/{budget:<4} {url}{login}'.format(
+            status='FAIL' if problems else 'ok',
+            endpoint=endpoint,
+            queries=len(recorder.statements),
+            budget=budget if budget is not None else '-',
+            url=url,
+            login=' (logged in)' if logged_in else '',
+        ))
+        for problem in problems:
+            print(u'     {0}'.format(problem))
+
+    checked = set(result['endpoint'] for result in results)
+    for endpoint in sorted(app.view_functions):
+        if endpoint not in checked and endpoint != 'static':
+            print(u'skip {0}'.format(endpoint))
+
+    wakatime.close_sessions()
+    server.shutdown()
+    server.server_close()
+    db.session.remove()
+    shutil.rmtree(app.config['SNAPSHOT_DIR'])
+    if args.output:
+        with open(args.output, 'w') as fh:
+            json.dump(results, fh, indent=2)
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,77 @@
+#!/usr/bin/env python
+"""
+    benchmarks.refresh
+    ~~~~~~~~~~~~~~~~~~
+
+    Throughput of RefreshEngine's summaries fan out against a local fake
+    WakaTime server, at increasing thread pool sizes.
+
+    Usage::
+
+        python -m benchmarks.refresh --requests 500 --latency 0.1
+"""
+
+
+import argparse
+import json
+import logging
+import sys
+import time
+from datetime import date, timedelta
+
+from app import app, cache, wakatime
+from app.ratelimit import TokenBucketRateLimiter
+from app.refresh import RefreshEngine
+
+from benchmarks.fake_wakatime import start_server
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the batch refresh engine.')
+    parser.add_argument('--requests', type=int, default=200)
+    parser.add_argument('--latency', type=float, default=0.05, help='seconds added to each fake api response')
+    parser.add_argument('--days', type=int, default=14)
+    parser.add_argument('--concurrency', default='1,4,8,16,32', help='comma separated thread pool sizes')
+    parser.add_argument('--rate-limit', type=int, default=0, help='requests per second, 0 for no limit')
+    parser.add_argument('--output', help='write results as json to this file')
+    args = parser.parse_args()
+
+    concurrencies = [int(c) for c in args.concurrency.split(',')]
+    server = start_server(latency=args.latency)
+    app.config['WAKATIME_BASE_URL'] = server.url
+    app.config['WAKATIME_POOL_SIZE'] = max(concurrencies)
+    cache.client = cache.LocalClient()
+    app.logger.setLevel(logging.WARNING)
+    wakatime.limiter = TokenBucketRateLimiter('benchmark', args.rate_limit) if args.rate_limit else None
+
+    end = date.today()
+    start = end - timedelta(days=args.days - 1)
+    jobs = [(i, 'token', start, end) for i in range(args.requests)]
+
+    results = []
+    for concurrency in concurrencies:
+        with RefreshEngine(concurrency=concurrency) as engine:
+            started = time.time()
+            fetched = engine.fetch_many(jobs)
+            elapsed = time.time() - started
+        failed = len([1 for _, result in fetched if isinstance(result, Exception)])
+        results.append({
+            'concurrency': concurrency,
+            'requests': len(jobs),
+            'failed': failed,
+            'elapsed_seconds': round(elapsed, 3),
+            'requests_per_second': round(len(jobs) / elapsed, 1),
+        })
+        print('concurrency={concurrency:<4} {requests} requests in {elapsed_seconds}s, {requests_per_second} req/s, {failed} failed'.format(**results[-1]))
+
+    wakatime.close_sessions()
+    server.shutdown()
+    server.server_close()
+    if args.output:
+        with open(args.output, 'w') as fh:
+            json.dump(results, fh, indent=2)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,205 @@
+#!/usr/bin/env python
+"""
+    benchmarks.serializers
+    ~~~~~~~~~~~~~~~~~~~~~~
+
+    Model.to_dict compared with the serializer it replaced, on lists of
+    unsaved Rank objects. Exits 1 when either, or app.json.to_primitive on
+    PRIMITIVE_VALUES, differs from the output it replaced.
+
+    Usage::
+
+        python -m benchmarks.serializers --count 10000
+"""
+
+
+import argparse
+import json
+import sys
+import timeit
+import uuid
+from collections import defaultdict, namedtuple, OrderedDict
+from datetime import date, datetime
+
+from flask import json as flask_json
+
+from app import json as app_json
+from app.models import Rank, User
+
+
+def legacy_to_dict(self, show=None, hide=None, path=None, show_all=None):
+    """Model.to_dict before serialization plans, for comparison.
+    """
+
+    # TODO: stop traversing objects if can
+
+    if not show:
+        show = []
+    if not hide:
+        hide = []
+    hidden = []
+    if hasattr(self, 'hidden_fields'):
+        hidden = self.hidden_fields
+    default = []
+    if hasattr(self, 'default_fields'):
+        default = self.default_fields
+
+    ret_data = {}
+
+    if not path:
+        path = self.__tablename__.lower()
+        def prepend_path(item):
+            item = item.lower()
+            if item.split('.', 1)[0] == path:
+                return item
+            if len(item) == 0:
+                return item
+            if item[0] != '.':
+                item = '.%s' % item
+            item = '%s%s' % (path, item)
+            return item
+        show[:] = [prepend_path(x) for x in show]
+        hide[:] = [prepend_path(x) for x in hide]
+
+    columns = self.__table__.columns.keys()
+    relationships = self.__mapper__.relationships.keys()
+    properties = dir(self)
+
+    for key in columns:
+        check = '%s.%s' % (path, key)
+        if check in hide or key in hidden:
+            continue
+        if show_all or key is 'id' or check in show or key in default:
+            ret_data[key] = getattr(self, key)
+
+    for key in relationships:
+        check = '%s.%s' % (path, key)
+        if check in hide or key in hidden:
+            continue
+        if show_all or check in show or key in default:
+            hide.append(check)
+            is_list = self.__mapper__.relationships[key].uselist
+            if is_list:
+                ret_data[key] = []
+                if self.__mapper__.relationships[key].query_class is not None:
+                    items = getattr(self, key).all()
+                else:
+                    items = getattr(self, key)
+                for item in items:
+                    ret_data[key].append(legacy_to_dict(item, 
+                        show=show,
+                        hide=hide,
+                        path=('%s.%s' % (path, key.lower())),
+                        show_all=show_all,
+                    ))
+            else:
+                if self.__mapper__.relationships[key].query_class is not None or self.__mapper__.relationships[key].instrument_class is not None:
+                    item = getattr(self, key)
+                    if item is not None:
+                        ret_data[key] = legacy_to_dict(item, 
+                            show=show,
+                            hide=hide,
+                            path=('%s.%s' % (path, key.lower())),
+                            show_all=show_all,
+                        )
+                    else:
+                        ret_data[key] = None
+                else:
+                    ret_data[key] = getattr(self, key)
+
+    for key in list(set(properties) - set(columns) - set(relationships)):
+        if key.startswith('_'):
+            continue
+        check = '%s.%s' % (path, key)
+        if check in hide or key in hidden:
+            continue
+        if show_all or check in show or key in default:
+            val = getattr(self, key)
+            try:
+                ret_data[key] = flask_json.loads(flask_json.dumps(val))
+            except:
+                pass
+
+    return ret_data
+
+
+def make_ranks(count):
+    ranks = []
+    for i in range(count):
+        user = User(
+            id=uuid.uuid4(),
+            email=u'hacker{0}@localhost'.format(i),
+            username=u'hacker{0}'.format(i),
+            full_name=u'Hacker {0}'.format(i),
+        )
+        ranks.append(Rank(
+            id=uuid.uuid4(),
+            user=user,
+            user_id=user.id,
+            hackathon_id=uuid.uuid4(),
+            total_seconds=i * 37,
+            created_at=datetime.utcnow(),
+        ))
+    return ranks
+
+
+Point = namedtuple('Point', ['x', 'y'])
+
+# property values to_primitive must convert like a json round trip does
+PRIMITIVE_VALUES = [
+    OrderedDict([('b', 1), ('a', [date(2015, 3, 1), uuid.UUID(int=1)])]),
+    defaultdict(list, {'seconds': [1, 2.5], 1: None}),
+    Point(datetime(2015, 3, 1, 12, 30), u'hacker'),
+    {'points': [Point(1, 2)], 'nested': OrderedDict([('ok', True)])},
+]
+
+
+CASES = [
+    ('default', {}),
+    ('columns', {'show': ['total_seconds', 'user_id', 'created_at']}),
+    ('properties', {'show': ['total_seconds', 'coding_time', 'full_name', 'username']}),
+    ('nested', {'show': ['total_seconds', 'user', 'user.username', 'user.full_name']}),
+]
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark Model.to_dict.')
+    parser.add_argument('--count', type=int, default=10000)
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--output', help='write results as json to this file')
+    args = parser.parse_args()
+
+    for value in PRIMITIVE_VALUES:
+        if app_json.to_primitive(value) != flask_json.loads(app_json.dumps(value)):
+            print('to_primitive differs from a json round trip for {0!r}'.format(value))
+            return 1
+
+    ranks = make_ranks(args.count)
+    results = []
+    for name, kwargs in CASES:
+        def serialize(func):
+            return [func(rank, **dict((k, list(v)) for k, v in kwargs.items())) for rank in ranks]
+
+        if serialize(legacy_to_dict) != serialize(Rank.to_dict):
+            print('{0}: output differs from legacy serializer'.format(name))
+            return 1
+
+        legacy = min(timeit.repeat(lambda: serialize(legacy_to_dict), number=1, repeat=args.repeat))
+        planned = min(timeit.repeat(lambda: serialize(Rank.to_dict), number=1, repeat=args.repeat))
+        results.append({
+            'case': name,
+            'count': args.count,
+            'legacy_seconds': round(legacy, 4),
+            'planned_seconds': round(planned, 4),
+            'speedup': round(legacy / planned, 2),
+        })
+        print('{case:<12} legacy {legacy_seconds}s, planned {planned_seconds}s, {speedup}x'.format(**results[-1]))
+
+    if args.output:
+        with open(args.output, 'w') as fh:
+            json.dump(results, fh, indent=2)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
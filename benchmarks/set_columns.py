@@ -0,0 +1,86 @@
+#!/usr/bin/env python
+"""
+    benchmarks.set_columns
+    ~~~~~~~~~~~~~~~~~~~~~~
+
+    Checks that Model.set_columns latency stays flat over many calls in one
+    process, and that readonly fields do not grow. Runs on Hackathon, which
+    declares readonly_fields.
+
+    Usage::
+
+        python -m benchmarks.set_columns --calls 100000
+"""
+
+
+import argparse
+import json
+import sys
+import time
+import uuid
+from datetime import datetime
+
+from app.models import Hackathon
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark Model.set_columns over many calls.')
+    parser.add_argument('--calls', type=int, default=100000)
+    parser.add_argument('--chunk', type=int, default=10000)
+    parser.add_argument('--tolerance', type=float, default=1.5, help='max slowdown of the last chunk over the first')
+    parser.add_argument('--output', help='write results as json to this file')
+    args = parser.parse_args()
+
+    now = datetime.utcnow()
+    hackathon = Hackathon(
+        id=uuid.uuid4(),
+        admin_id=uuid.uuid4(),
+        name=u'set_columns',
+        coding_starts_at=now,
+        coding_ends_at=now,
+        timezone=u'UTC',
+        participants_count=0,
+        total_seconds=0,
+    )
+    readonly_count = len(Hackathon.readonly_fields)
+    readonly_fields = list(Hackathon.readonly_fields)
+    plan = Hackathon._write_plan()
+
+    chunks = []
+    for chunk in range(args.calls // args.chunk):
+        started = time.time()
+        for i in range(chunk * args.chunk, (chunk + 1) * args.chunk):
+            hackathon.set_columns(name=u'set_columns {0}'.format(i), id=uuid.uuid4(), participants_count=i, total_seconds=i)
+        chunks.append(time.time() - started)
+
+    per_call = [elapsed / args.chunk * 1000000 for elapsed in chunks]
+    result = {
+        'calls': args.calls,
+        'first_chunk_usec_per_call': round(per_call[0], 2),
+        'last_chunk_usec_per_call': round(per_call[-1], 2),
+        'slowdown': round(per_call[-1] / per_call[0], 3),
+    }
+    print('{calls} calls: first chunk {first_chunk_usec_per_call}us/call, last chunk {last_chunk_usec_per_call}us/call, {slowdown}x'.format(**result))
+
+    if args.output:
+        with open(args.output, 'w') as fh:
+            json.dump(result, fh, indent=2)
+
+    if len(Hackathon.readonly_fields) != readonly_count or Hackathon.readonly_fields != readonly_fields:
+        print('Readonly fields changed between calls: {0}'.format(Hackathon.readonly_fields))
+        return 1
+    if Hackathon._write_plan() is not plan:
+        print('Write plan changed between calls.')
+        return 1
+    written = set(['id'] + readonly_fields) & set(hackathon.get_changes())
+    if written:
+        print('Readonly fields were written: {0}'.format(', '.join(sorted(written))))
+        return 1
+    if result['slowdown'] > args.tolerance:
+        print('set_columns slowed down by more than {0}x.'.format(args.tolerance))
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,215 @@
+#!/usr/bin/env python
+"""
+    benchmarks.suite
+    ~~~~~~~~~~~~~~~~
+
+    Benchmarks the models, serializers and views against a seeded database,
+    with one hackathon per size of leaderboard, and saves the results as
+    json so runs can be compared between commits.
+
+    Seeds a local Postgres, or by default an in-memory SQLite stand-in.
+    The database's tables are dropped first, so never point it at real
+    data.
+
+    Usage::
+
+        python -m benchmarks.suite --database-url postgresql://localhost/hackathonranks_bench --output before.json
+        python -m benchmarks.suite --database-url postgresql://localhost/hackathonranks_bench --compare before.json
+"""
+
+
+import argparse
+import json
+import platform
+import subprocess
+import sys
+import time
+from datetime import datetime, timedelta
+
+from app import app, cache, standings
+from app import json as app_json
+from app.models import db, Rank, User
+
+from benchmarks.database import seed_hackathon, setup
+
+
+# slowdowns smaller than this are treated as timer noise
+NOISE_SECONDS = 0.002
+
+
+def timed(func, repeat):
+    """Run func repeat times, returning the fastest and median seconds.
+    """
+    times = []
+    for _ in range(repeat):
+        started = time.time()
+        func()
+        times.append(time.time() - started)
+    times.sort()
+    return times[0], times[len(times) // 2]
+
+
+def benchmarks(size, hackathon_name, hackathon_id, user_ids, client):
+    """Yield (name, number of operations, function) for one seeded
+    hackathon.
+    """
+    page = app.config['LEADERBOARD_PAGE_SIZE']
+    loaded = min(size, app.config['LEADERBOARD_MAX_TOP'])
+    ranks = Rank.query.filter_by(hackathon_id=hackathon_id).order_by(Rank.total_seconds.desc()).limit(loaded).all()
+    for rank in ranks:
+        rank.user
+
+    yield 'to_dict', loaded, lambda: [rank.to_dict(show=['user', 'user.username']) for rank in ranks]
+    yield 'set_columns', loaded, lambda: [rank.set_columns(total_seconds=rank.total_seconds + 1) for rank in ranks]
+    db.session.rollback()
+
+    rows = [rank.to_dict(show=['total_seconds', 'created_at', 'user_id']) for rank in ranks]
+    yield 'json_dumps', loaded, lambda: app_json.dumps({'data': rows})
+    yield 'json_iterencode', loaded, lambda: list(app_json.iterencode({'data': rows}))
+
+    board = standings.load_from_database(hackathon_id)
+    probes = user_ids[::max(1, size // 100)]
+    yield 'standings_build', size, lambda: standings.load_from_database(hackathon_id)
+    yield 'standings_position', len(probes), lambda: [board.position(user_id) for user_id in probes]
+    yield 'standings_neighbours', len(probes), lambda: [board.neighbours(user_id, 5) for user_id in probes]
+
+    existing = user_ids[:min(size, 100)]
+    yield 'get_or_create_existing', len(existing), lambda: [User.get_or_create(id=user_id) for user_id in existing]
+
+    def get_or_create_new():
+        for i in range(10):
+            User.get_or_create(
+                wakatime_id=u'new-{0}-{1}-{2}'.format(size, i, time.time()),
+                defaults={'email': u'new-{0}-{1}-{2}@localhost'.format(size, i, time.time()), 'wakatime_token': u'token'},
+            )
+        db.session.rollback()
+
+    # pysqlite's own transaction handling breaks the savepoint this uses
+    if db.engine.dialect.name != 'sqlite':
+        yield 'get_or_create_new', 10, get_or_create_new
+
+    def get(url, flush):
+        def request():
+            if flush:
+                cache.client.flush_all()
+            response = client.get(url)
+            response.get_data()
+            assert response.status_code == 200, (url, response.status_code)
+            db.session.remove()
+        return request
+
+    path = u'/hackathon/' + hackathon_name
+    yield 'view_index_cold', 1, get('/', flush=True)
+    yield 'view_index_warm', 1, get('/', flush=False)
+    yield 'view_hackathon_cold', 1, get(path, flush=True)
+    yield 'view_hackathon_warm', 1, get(path, flush=False)
+    if size > page:
+        last = db.session.query(Rank.total_seconds, Rank.id).filter(
+            Rank.hackathon_id == hackathon_id,
+        ).order_by(Rank.total_seconds.desc(), Rank.id.desc()).offset(size - page - 1).first()
+        url = u'{0}?after={1},{2}&start={3}'.format(path, last[0], last[1], size - page)
+        yield 'view_hackathon_last_page', 1, get(url, flush=True)
+    yield 'view_hackathon_top', 1, get(u'{0}?top={1}'.format(path, app.config['LEADERBOARD_MAX_TOP']), flush=True)
+    yield 'view_hackathon_all', 1, get(u'{0}?top=all'.format(path), flush=True)
+    yield 'view_leaderboard_json', 1, get(u'{0}/leaderboard.json'.format(path), flush=False)
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', 'HEAD']).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(results, previous, threshold):
+    """Print each benchmark's change from a previous run. Returns the
+    benchmarks whose fastest run is slower than threshold times the
+    previous fastest run, ignoring differences within NOISE_SECONDS.
+    """
+    before = dict(((r['name'], r['size']), r) for r in previous['results'])
+    slower = []
+    for result in results:
+        old = before.get((result['name'], result['size']))
+        if not old or not old['min_seconds']:
+            continue
+        ratio = result['min_seconds'] / old['min_seconds']
+        flag = ''
+        if ratio > threshold and result['min_seconds'] - old['min_seconds'] > NOISE_SECONDS:
+            slower.append(result)
+            flag = '  SLOWER'
+        print('{name:<26} {size:>7} {old:>10.5f}s -> {new:>10.5f}s {ratio:>6.2f}x{flag}'.format(
+            name=result['name'],
+            size=result['size'],
+            old=old['min_seconds'],
+            new=result['min_seconds'],
+            ratio=ratio,
+            flag=flag,
+        ))
+    return slower
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark models, serializers and views.')
+    parser.add_argument('--database-url', default='sqlite://')
+    parser.add_argument('--sizes', default='100,1000,10000,100000', help='comma separated ranks per hackathon')
+    parser.add_argument('--repeat', type=int, default=10)
+    parser.add_argument('--only', help='comma separated benchmark names to run')
+    parser.add_argument('--output', help='write results as json to this file')
+    parser.add_argument('--compare', help='results json from a previous run to compare with')
+    parser.add_argument('--threshold', type=float, default=1.25, help='slowdown over the previous run that fails')
+    args = parser.parse_args()
+
+    sizes = [int(size) for size in args.sizes.split(',')]
+    only = set(args.only.split(',')) if args.only else None
+    setup(args.database_url)
+
+    now = datetime.utcnow()
+    seeded = []
+    for size in sizes:
+        started = time.time()
+        name = u'bench-{0}'.format(size)
+        hackathon_id, user_ids = seed_hackathon(name, size, now - timedelta(days=1), now + timedelta(days=1))
+        seeded.append((size, name, hackathon_id, user_ids))
+        print('seeded {0} ranks in {1:.1f}s'.format(size, time.time() - started))
+
+    client = app.test_client()
+    results = []
+    for size, name, hackathon_id, user_ids in seeded:
+        for benchmark, operations, func in benchmarks(size, name, hackathon_id, user_ids, client):
+            if only and benchmark not in only:
+                continue
+            fastest, median = timed(func, args.repeat)
+            results.append({
+                'name': benchmark,
+                'size': size,
+                'operations': operations,
+                'min_seconds': round(fastest, 6),
+                'median_seconds': round(median, 6),
+                'usec_per_operation': round(median / operations * 1000000, 2),
+            })
+            print('{name:<26} {size:>7} {median_seconds:>10.5f}s {usec_per_operation:>12.2f}us/op'.format(**results[-1]))
+        db.session.remove()
+
+    run = {
+        'commit': git_commit(),
+        'created_at': datetime.utcnow().strftime('%Y-%m-%dT%H:%M:%SZ'),
+        'python': platform.python_version(),
+        'database': db.engine.dialect.name,
+        'repeat': args.repeat,
+        'results': results,
+    }
+    if args.output:
+        with open(args.output, 'w') as fh:
+            json.dump(run, fh, indent=2)
+
+    if args.compare:
+        with open(args.compare) as fh:
+            previous = json.load(fh)
+        print('compared with {0}'.format(previous.get('commit')))
+        if compare(results, previous, args.threshold):
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,138 @@
+#!/usr/bin/env python
+"""
+    benchmarks.upsert
+    ~~~~~~~~~~~~~~~~~
+
+    Checks Model.upsert_many, whose INSERT ... ON CONFLICT DO UPDATE ...
+    RETURNING statement is compiled by hand in app.models.compile_upsert:
+    inserting new rows, updating existing ones in the same statement, and
+    rolling back or releasing an upsert in a savepoint. Exits 1 when any
+    check fails.
+
+    Runs against a local Postgres 9.5 or newer, or by default an in-memory
+    SQLite database, which supports the statement from SQLite 3.35.
+
+    Usage::
+
+        python -m benchmarks.upsert
+        python -m benchmarks.upsert --database-url postgresql://localhost/hackathonranks_test
+"""
+
+
+import argparse
+import sys
+from datetime import date, timedelta
+
+from app import cache
+from app.models import db, DailyTotal, User
+
+from benchmarks.database import setup
+
+
+def user_row(i, **kwargs):
+    row = {
+        'wakatime_id': u'upsert{0}'.format(i),
+        'wakatime_token': u'token{0}'.format(i),
+        'email': u'upsert{0}@localhost'.format(i),
+        'full_name': u'Upsert {0}'.format(i),
+    }
+    row.update(kwargs)
+    return row
+
+
+def check_insert():
+    users = User.upsert_many([user_row(1), user_row(2)])
+    db.session.commit()
+    assert [user.wakatime_id for user in users] == [u'upsert1', u'upsert2']
+    assert all(user.id is not None and user.created_at is not None for user in users)
+    assert User.query.filter(User.wakatime_id.in_([u'upsert1', u'upsert2'])).count() == 2
+
+
+def check_update():
+    before = dict((user.wakatime_id, (user.id, user.created_at)) for user in User.query)
+    users = User.upsert_many([
+        user_row(3),
+        user_row(2, full_name=u'Renamed', wakatime_token=u'new token'),
+    ])
+    db.session.commit()
+    assert [user.wakatime_id for user in users] == [u'upsert3', u'upsert2']
+    updated = users[1]
+    assert (updated.id, updated.created_at) == before[u'upsert2']
+    assert updated.full_name == u'Renamed' and updated.wakatime_token == u'new token'
+    assert updated.modified_at is not None
+    db.session.expire_all()
+    assert User.query.filter_by(wakatime_id=u'upsert2').one().full_name == u'Renamed'
+    assert User.query.filter_by(wakatime_id=u'upsert1').one().full_name == u'Upsert 1'
+    assert User.query.count() == 3
+
+
+def check_composite_key():
+    user = User.query.filter_by(wakatime_id=u'upsert1').one()
+    today = date.today()
+    DailyTotal.store_many({user.id: {today: 60, today - timedelta(days=1): 30}}, today)
+    DailyTotal.store_many({user.id: {today: 90}}, today)
+    db.session.commit()
+    totals = dict(db.session.query(DailyTotal.date, DailyTotal.total_seconds).filter_by(user_id=user.id))
+    assert totals == {today: 90, today - timedelta(days=1): 30}
+
+
+def check_savepoint_rollback():
+    user = User.query.filter_by(wakatime_id=u'upsert1').one()
+    namespace = cache.user_namespace(user.id)
+    version = cache.get_version(namespace)
+    db.session.begin_nested()
+    User.upsert(**user_row(1, full_name=u'Rolled back'))
+    User.upsert(**user_row(4))
+    db.session.rollback()
+    db.session.commit()
+    db.session.expire_all()
+    assert User.query.filter_by(wakatime_id=u'upsert1').one().full_name == u'Upsert 1'
+    assert User.query.filter_by(wakatime_id=u'upsert4').first() is None
+    assert cache.get_version(namespace) == version
+
+
+def check_savepoint_release():
+    user = User.query.filter_by(wakatime_id=u'upsert1').one()
+    namespace = cache.user_namespace(user.id)
+    version = cache.get_version(namespace)
+    db.session.begin_nested()
+    User.upsert(**user_row(1, full_name=u'Released'))
+    db.session.commit()
+    assert cache.get_version(namespace) == version
+    db.session.commit()
+    db.session.expire_all()
+    assert User.query.filter_by(wakatime_id=u'upsert1').one().full_name == u'Released'
+    assert cache.get_version(namespace) != version
+
+
+CHECKS = [
+    ('insert', check_insert),
+    ('update', check_update),
+    ('composite_key', check_composite_key),
+    ('savepoint_rollback', check_savepoint_rollback),
+    ('savepoint_release', check_savepoint_release),
+]
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Check Model.upsert_many.')
+    parser.add_argument('--database-url', default='sqlite://')
+    args = parser.parse_args()
+
+    setup(args.database_url)
+    failed = False
+    for name, check in CHECKS:
+        try:
+            check()
+        except AssertionError:
+            db.session.rollback()
+            failed = True
+            print('FAIL {0}'.format(name))
+        else:
+            print('ok   {0}'.format(name))
+    db.session.remove()
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())